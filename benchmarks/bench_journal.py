@@ -0,0 +1,173 @@
+# benchmarks/bench_journal.py
+"""Write throughput and restart time of the journaled in-memory OrderStore
+
+    python benchmarks/bench_journal.py --sizes 10000,100000,1000000 --threads 1,16
+
+- writes: orders/s through OrderStore.add with each JOURNAL_SYNC mode and with no
+  journal, and how many records each fsync covered (group commit)
+- recovery: time for a fresh process to open the journal, against the number of
+  orders, when it must replay the whole log and when it loads a snapshot plus a tail
+  of --tail updates
+
+Each fill and each recovery runs in a forked child. The fill exits without closing the
+journal, like a crash, so no final snapshot is written for it.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from common import print_table, use_service, write_results
+
+use_service("order")
+
+from journal import Journal  # noqa: E402
+from order_store import OrderStore  # noqa: E402
+
+# Large enough that no snapshot is taken unless a benchmark asks for one
+NEVER = 10**12
+
+
+def sample_order(i):
+    return {
+        "user_id": i % 1000,
+        "product_id": i % 50,
+        "quantity": 1 + i % 5,
+        "status": ("pending", "completed", "cancelled")[i % 3],
+        "payment_method": "credit_card",
+        "amount": 100.0 + i % 900,
+        "created_at": "2026-01-01T00:00:00",
+    }
+
+
+def in_child(target, *args):
+    """Run target(*args) in a forked process and return its result"""
+    context = multiprocessing.get_context("fork")
+    results = context.SimpleQueue()
+    child = context.Process(target=lambda: results.put(target(*args)))
+    child.start()
+    result = results.get()
+    child.join()
+    return result
+
+
+def directory_bytes(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def bench_writes(writes, thread_counts, directory):
+    rows = []
+    for sync in (None, "off", "interval", "always"):
+        for threads in thread_counts:
+            path = os.path.join(directory, f"writes-{sync}-{threads}")
+            store = OrderStore()
+            journal = None
+            if sync is not None:
+                journal = Journal(path, sync=sync, snapshot_records=NEVER, snapshot_interval=NEVER)
+                store.open_journal(journal)
+
+            def write(count, offset):
+                for i in range(count):
+                    store.add(sample_order(offset + i))
+
+            per_thread = writes // threads
+            workers = [threading.Thread(target=write, args=(per_thread, n * per_thread)) for n in range(threads)]
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+
+            fsyncs = journal.fsyncs if journal else 0
+            rows.append(
+                {
+                    "sync": sync or "no journal",
+                    "threads": threads,
+                    "writes_per_s": round(per_thread * threads / elapsed),
+                    "fsyncs": fsyncs,
+                    "records_per_fsync": round(per_thread * threads / fsyncs, 1) if fsyncs else None,
+                }
+            )
+            if journal:
+                journal.close()
+            shutil.rmtree(path, ignore_errors=True)
+    return rows
+
+
+def fill(path, size, snapshot, tail):
+    journal = Journal(path, sync="off", snapshot_records=NEVER, snapshot_interval=NEVER)
+    store = OrderStore()
+    store.open_journal(journal)
+    for i in range(size):
+        store.add(sample_order(i))
+    started = time.perf_counter()
+    if snapshot:
+        store.checkpoint()
+    snapshot_seconds = time.perf_counter() - started
+    for i in range(tail):
+        store.update(1 + i % size, status="completed")
+    journal.sync_now()
+    return snapshot_seconds
+
+
+def recover(path):
+    started = time.perf_counter()
+    store = OrderStore()
+    store.open_journal(Journal(path, snapshot_records=NEVER, snapshot_interval=NEVER))
+    return time.perf_counter() - started, len(store)
+
+
+def bench_recovery(sizes, tail, directory):
+    rows = []
+    for size in sizes:
+        for snapshot in (False, True):
+            path = os.path.join(directory, f"recovery-{size}-{snapshot}")
+            snapshot_seconds = in_child(fill, path, size, snapshot, tail if snapshot else 0)
+            on_disk = directory_bytes(path)
+            seconds, recovered = in_child(recover, path)
+            assert recovered == size, f"recovered {recovered} of {size} orders"
+            rows.append(
+                {
+                    "orders": size,
+                    "startup": f"snapshot + {tail} records" if snapshot else f"replay {size} records",
+                    "recover_s": round(seconds, 3),
+                    "orders_per_s": round(size / seconds),
+                    "snapshot_write_s": round(snapshot_seconds, 3) if snapshot else None,
+                    "disk_mb": round(on_disk / 2**20, 1),
+                }
+            )
+            shutil.rmtree(path, ignore_errors=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated order counts")
+    parser.add_argument("--tail", type=int, default=10000, help="updates logged after the snapshot")
+    parser.add_argument("--writes", type=int, default=20000, help="orders written per write benchmark")
+    parser.add_argument("--threads", default="1,16", help="comma-separated writer thread counts")
+    parser.add_argument("--dir", help="journal directory (default: a temporary directory)")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="bench-journal-")
+    try:
+        writes = bench_writes(args.writes, [int(n) for n in args.threads.split(",")], directory)
+        print_table(writes, ["sync", "threads", "writes_per_s", "fsyncs", "records_per_fsync"])
+        print()
+        recovery = bench_recovery([int(size) for size in args.sizes.split(",")], args.tail, directory)
+        print_table(recovery, ["orders", "startup", "recover_s", "orders_per_s", "snapshot_write_s", "disk_mb"])
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    path = write_results("journal", {"directory": directory, "writes": writes, "recovery": recovery}, args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
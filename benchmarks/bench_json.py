@@ -0,0 +1,131 @@
+# benchmarks/bench_json.py
+"""CPU cost of JSON list responses and order event payloads: Flask's default vs serialization.py
+
+    python benchmarks/bench_json.py --sizes 100,1000,10000,100000
+
+- responses: jsonify() of a list of N orders to response bytes, through Flask's
+  DefaultJSONProvider and through FastJSONProvider (orjson, or its stdlib fallback)
+- events: encoding and decoding one order event with stdlib json and with
+  serialization.dumps()/loads()
+
+Times are CPU seconds of this process (time.process_time), so they measure the work
+saved rather than wall-clock noise.
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from common import print_table, use_service, write_results
+
+use_service("order")
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+import serialization  # noqa: E402
+
+
+def sample_orders(count):
+    created_at = datetime(2026, 1, 1, 12, 34, 56, 789012)
+    return [
+        {
+            "id": i,
+            "user_id": i % 1000,
+            "product_id": i % 50,
+            "quantity": 1 + i % 5,
+            "status": ("pending", "completed", "cancelled")[i % 3],
+            "payment_method": "credit_card",
+            "amount": 100.0 + i % 900,
+            "created_at": created_at,
+        }
+        for i in range(count)
+    ]
+
+
+def cpu_per_call(operation, min_seconds):
+    """Mean CPU seconds per call, repeating until at least min_seconds of CPU time was spent"""
+    calls = 0
+    started = time.process_time()
+    while True:
+        operation()
+        calls += 1
+        spent = time.process_time() - started
+        if spent >= min_seconds:
+            return spent / calls
+
+
+def bench_responses(sizes, min_seconds):
+    default_app = Flask("default")
+    default_app.json = DefaultJSONProvider(default_app)
+    fast_app = Flask("fast")
+    serialization.init_app(fast_app)
+
+    rows = []
+    for size in sizes:
+        orders = sample_orders(size)
+        # The default provider cannot encode datetime, so it gets the pre-formatted strings
+        # the service used to store
+        formatted = [dict(order, created_at=order["created_at"].isoformat()) for order in orders]
+        results = {}
+        for name, app, payload in (("default", default_app, formatted), ("fast", fast_app, orders)):
+            with app.app_context():
+                body = app.json.response(payload).get_data()
+                seconds = cpu_per_call(lambda: app.json.response(payload).get_data(), min_seconds)
+            results[name] = (seconds, len(body))
+        rows.append(
+            {
+                "orders": size,
+                "default_ms": round(results["default"][0] * 1000, 3),
+                "fast_ms": round(results["fast"][0] * 1000, 3),
+                "speedup": round(results["default"][0] / results["fast"][0], 2),
+                "default_bytes": results["default"][1],
+                "fast_bytes": results["fast"][1],
+            }
+        )
+    return rows
+
+
+def bench_events(min_seconds):
+    event = dict(sample_orders(1)[0], created_at="2026-01-01T12:34:56.789012")
+    body = json.dumps(event).encode()
+    operations = {
+        "encode": (lambda: json.dumps(event).encode("utf-8"), lambda: serialization.dumps(event)),
+        "decode": (lambda: json.loads(body), lambda: serialization.loads(body)),
+    }
+    rows = []
+    for name, (stdlib, fast) in operations.items():
+        stdlib_seconds = cpu_per_call(stdlib, min_seconds)
+        fast_seconds = cpu_per_call(fast, min_seconds)
+        rows.append(
+            {
+                "operation": name,
+                "stdlib_us": round(stdlib_seconds * 1e6, 3),
+                "fast_us": round(fast_seconds * 1e6, 3),
+                "speedup": round(stdlib_seconds / fast_seconds, 2),
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000,100000", help="comma-separated list lengths")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="CPU seconds per measurement")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    encoder = "orjson" if serialization.orjson is not None else "stdlib fallback"
+    print(f"Fast path: {encoder}\n")
+    responses = bench_responses([int(size) for size in args.sizes.split(",")], args.min_seconds)
+    print_table(responses, ["orders", "default_ms", "fast_ms", "speedup", "default_bytes", "fast_bytes"])
+    print()
+    events = bench_events(args.min_seconds)
+    print_table(events, ["operation", "stdlib_us", "fast_us", "speedup"])
+
+    path = write_results("json", {"encoder": encoder, "responses": responses, "events": events}, args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
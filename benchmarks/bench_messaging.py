@@ -0,0 +1,272 @@
+# benchmarks/bench_messaging.py
+"""Order event messaging benchmarks: codecs, the outbox, and publish/consume throughput
+
+    python benchmarks/bench_messaging.py --messages 50000
+
+- codecs: body size and encode/decode time for each registered order event serializer
+- outbox: append, batched append and claim/mark_published cycles on a throwaway file
+- pipeline: events published through encode_event()/message_properties() into a fanout
+  exchange and consumed with rabbitmq_consumer.process_order() and its AckBatcher, on
+  the in-process broker in fake_amqp.py
+- wire: the same flow over a real socket, from event_publisher.ConfirmingPublisher to a
+  pika consumer through fake_amqp.FakeAmqpServer, with and without confirm latency
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from common import print_table, summarize, timed, use_service, write_results
+import pika
+from fake_amqp import Broker, FakeAmqpServer, Faults
+
+use_service("order")
+
+from event_publisher import ConfirmingPublisher  # noqa: E402
+from messaging import (  # noqa: E402
+    ORDER_CREATED,
+    ORDER_EVENTS_EXCHANGE,
+    JsonSerializer,
+    MsgpackSerializer,
+    OrderStructSerializer,
+    encode_event,
+    get_serializer,
+    message_properties,
+)
+from outbox import Outbox  # noqa: E402
+from rabbitmq_consumer import AckBatcher, process_order  # noqa: E402
+
+SAMPLE_ORDER = {
+    "id": 123456,
+    "user_id": 42,
+    "product_id": 7,
+    "quantity": 2,
+    "status": "pending",
+    "payment_method": "credit_card",
+    "amount": 1999.5,
+    "created_at": "2026-01-01T12:34:56.789012",
+}
+
+
+def available_serializers():
+    serializers = []
+    for serializer_class in (JsonSerializer, MsgpackSerializer, OrderStructSerializer):
+        try:
+            serializers.append(get_serializer(serializer_class.content_type))
+        except ValueError:
+            pass  # msgpack is optional
+    return serializers
+
+
+def bench_codecs(iterations):
+    rows = []
+    for serializer in available_serializers():
+        body = serializer.dumps(SAMPLE_ORDER)
+        encode = timed(lambda i: serializer.dumps(SAMPLE_ORDER), iterations)
+        decode = timed(lambda i: serializer.loads(body), iterations)
+        rows.append(
+            {
+                "content_type": serializer.content_type,
+                "bytes": len(body),
+                "encode_us": round(encode["mean_ms"] * 1000, 3),
+                "decode_us": round(decode["mean_ms"] * 1000, 3),
+            }
+        )
+    return rows
+
+
+def bench_outbox(messages, batch_size):
+    directory = tempfile.mkdtemp(prefix="bench-outbox-")
+    body, serializer = encode_event(SAMPLE_ORDER)
+    rows = []
+
+    outbox = Outbox(os.path.join(directory, "single.db"))
+    content_type = serializer.content_type
+    single = timed(
+        lambda i: outbox.append(f"order-created-{i}", body, content_type=content_type, event_type=ORDER_CREATED),
+        messages,
+    )
+    rows.append({"operation": "append", **single})
+    outbox.close()
+
+    outbox = Outbox(os.path.join(directory, "batched.db"))
+    batches = range(0, messages, batch_size)
+    started = time.perf_counter()
+    for start in batches:
+        outbox.append_many(
+            (f"order-created-{i}", body, "", serializer.content_type, ORDER_CREATED)
+            for i in range(start, min(start + batch_size, messages))
+        )
+    elapsed = time.perf_counter() - started
+    rows.append(
+        {"operation": f"append_many({batch_size})", "count": messages, "ops_per_sec": round(messages / elapsed, 1)}
+    )
+
+    started = time.perf_counter()
+    relayed = 0
+    while True:
+        batch = outbox.claim(batch_size)
+        if not batch:
+            break
+        outbox.mark_published([entry.id for entry in batch])
+        relayed += len(batch)
+    elapsed = time.perf_counter() - started
+    rows.append(
+        {
+            "operation": f"claim+mark_published({batch_size})",
+            "count": relayed,
+            "ops_per_sec": round(relayed / elapsed, 1),
+        }
+    )
+    outbox.close()
+    return rows
+
+
+def bench_pipeline(messages, serializer, ack_batch_size, prefetch):
+    broker = Broker()
+    broker.exchange_declare(ORDER_EVENTS_EXCHANGE, "fanout")
+    broker.queue_declare("order_consumer_queue")
+    broker.queue_bind("order_consumer_queue", ORDER_EVENTS_EXCHANGE)
+    channel = broker.channel()
+    channel.basic_qos(prefetch_count=prefetch)
+    acks = AckBatcher(channel, batch_size=ack_batch_size)
+    latencies = []
+
+    def callback(ch, method, properties, body):
+        acks.track(method.delivery_tag)
+        process_order(body, properties.content_type)
+        acks.ack(method.delivery_tag)
+        latencies.append(time.perf_counter() - properties.headers["published_at"])
+        if len(latencies) == messages:
+            acks.flush()
+            ch.stop_consuming()
+
+    def publish():
+        for i in range(messages):
+            event = dict(SAMPLE_ORDER, id=i)
+            body, used = encode_event(event, serializer)
+            properties = message_properties(
+                used.content_type, message_id=f"order-created-{i}", headers={"published_at": time.perf_counter()}
+            )
+            broker.publish(ORDER_EVENTS_EXCHANGE, "", body, properties)
+
+    channel.basic_consume("order_consumer_queue", callback)
+    started = time.perf_counter()
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    channel.start_consuming()
+    elapsed = time.perf_counter() - started
+    publisher.join()
+    return {
+        "content_type": serializer.content_type,
+        "ack_batch_size": ack_batch_size,
+        "prefetch": prefetch,
+        **summarize(latencies, elapsed),
+    }
+
+
+def bench_wire(messages, confirm_delay, prefetch):
+    """Publisher confirms and consumption over AMQP on localhost, with injected confirm latency"""
+    server = FakeAmqpServer(Broker(Faults(confirm_delay=confirm_delay))).start()
+    connection = pika.BlockingConnection(pika.URLParameters(server.url))
+    channel = connection.channel()
+    channel.exchange_declare(ORDER_EVENTS_EXCHANGE, "fanout", durable=True)
+    channel.queue_declare("order_consumer_queue", durable=True)
+    channel.queue_bind("order_consumer_queue", ORDER_EVENTS_EXCHANGE)
+    channel.basic_qos(prefetch_count=prefetch)
+    acks = AckBatcher(channel, batch_size=50)
+    latencies = []
+
+    def callback(ch, method, properties, body):
+        acks.track(method.delivery_tag)
+        process_order(body, properties.content_type)
+        acks.ack(method.delivery_tag)
+        latencies.append((time.perf_counter_ns() - properties.headers["published_at"]) / 1e9)
+        if len(latencies) == messages:
+            acks.flush()
+            ch.stop_consuming()
+
+    publisher = ConfirmingPublisher(server.url)
+    publisher.start()
+    confirm_latencies = []
+
+    def publish():
+        futures = []
+        for i in range(messages):
+            body, used = encode_event(dict(SAMPLE_ORDER, id=i))
+            sent = time.perf_counter_ns()  # AMQP header tables have no float type
+            properties = message_properties(
+                used.content_type, message_id=f"order-created-{i}", headers={"published_at": sent}
+            )
+            future = publisher.publish(body, properties)
+            future.add_done_callback(lambda _, sent=sent: confirmed(sent))
+            futures.append(future)
+        for future in futures:
+            future.result()
+
+    def confirmed(sent):
+        confirm_latencies.append((time.perf_counter_ns() - sent) / 1e9)
+
+    channel.basic_consume("order_consumer_queue", callback)
+    started = time.perf_counter()
+    producer = threading.Thread(target=publish)
+    producer.start()
+    channel.start_consuming()
+    elapsed = time.perf_counter() - started
+    producer.join()
+    publisher.close()
+    connection.close()
+    server.close()
+    confirms = summarize(confirm_latencies, elapsed)
+    return {
+        "confirm_delay_ms": confirm_delay * 1000,
+        "confirm_p99_ms": confirms["p99_ms"],
+        **summarize(latencies, elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000, help="events per outbox and pipeline run")
+    parser.add_argument("--codec-iterations", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500, help="outbox batch size")
+    parser.add_argument("--prefetch", type=int, default=200)
+    parser.add_argument("--wire-messages", type=int, default=5000, help="events per run over the socket broker")
+    parser.add_argument(
+        "--confirm-delays", default="0,2", help="comma-separated injected confirm latencies in ms for the wire runs"
+    )
+    parser.add_argument("--output", help="results file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    codecs = bench_codecs(args.codec_iterations)
+    print_table(codecs, ["content_type", "bytes", "encode_us", "decode_us"])
+    print()
+
+    outbox = bench_outbox(args.messages, args.batch_size)
+    print_table(outbox, ["operation", "count", "p50_ms", "p99_ms", "ops_per_sec"])
+    print()
+
+    pipeline = [
+        bench_pipeline(args.messages, serializer, ack_batch_size, args.prefetch)
+        for serializer in available_serializers()
+        for ack_batch_size in (1, 50)
+    ]
+    print_table(pipeline, ["content_type", "ack_batch_size", "p50_ms", "p99_ms", "ops_per_sec"])
+    print()
+
+    wire = [
+        bench_wire(args.wire_messages, float(delay) / 1000, args.prefetch)
+        for delay in args.confirm_delays.split(",")
+    ]
+    print_table(wire, ["confirm_delay_ms", "confirm_p99_ms", "p50_ms", "p99_ms", "ops_per_sec"])
+
+    results = {"codecs": codecs, "outbox": outbox, "pipeline": pipeline, "wire": wire}
+    path = write_results("messaging", results, args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/common.py
+"""Shared helpers for the benchmark scripts: timing, latency summaries and JSON results"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+
+
+def use_service(service):
+    """Make one service's modules importable; services share module names, so one per process"""
+    sys.path.insert(0, str(REPO_ROOT / f"{service}-service"))
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, elapsed=None):
+    """Latency percentiles in milliseconds plus throughput for a list of durations in seconds"""
+    latencies = sorted(latencies)
+    elapsed = sum(latencies) if elapsed is None else elapsed
+    count = len(latencies)
+    return {
+        "count": count,
+        "mean_ms": round(sum(latencies) / count * 1000, 4) if count else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4) if count else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 4) if count else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4) if count else None,
+        "max_ms": round(latencies[-1] * 1000, 4) if count else None,
+        "ops_per_sec": round(count / elapsed, 1) if elapsed else None,
+    }
+
+
+def timed(operation, iterations):
+    """Run operation(i) `iterations` times and summarize the per-call latencies"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def environment():
+    """Where the numbers came from, so result files can be compared fairly"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+    }
+
+
+def write_results(benchmark, results, output=None):
+    """Save results as JSON under benchmarks/results/ (or `output`) and return the path"""
+    timestamp = datetime.now(timezone.utc)
+    if output is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULTS_DIR / f"{benchmark}-{timestamp.strftime('%Y%m%dT%H%M%SZ')}.json"
+    document = {
+        "benchmark": benchmark,
+        "timestamp": timestamp.isoformat(),
+        "environment": environment(),
+        "results": results,
+    }
+    Path(output).write_text(json.dumps(document, indent=2) + "\n")
+    return Path(output)
+
+
+def print_table(rows, columns):
+    """Print result dicts as an aligned text table"""
+    widths = [max(len(str(column)), *(len(str(row.get(column, ""))) for row in rows)) for column in columns]
+    print("  ".join(str(column).ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(width) for column, width in zip(columns, widths)))
@@ -0,0 +1,800 @@
+# benchmarks/fake_amqp.py
+"""A small AMQP 0-9-1 broker for tests and benchmarks, in-process or on localhost
+
+Implements the parts of RabbitMQ the order event paths use: fanout and direct
+exchanges, durable queues, per-channel prefetch, acks/nacks/rejects with requeue,
+publisher confirms, and queue TTL with dead-lettering (the consumer's retry tiers).
+Faults holds injectable confirm and delivery latency, nacks, dropped messages and
+disconnects.
+
+Two front ends share one Broker:
+
+- Broker.channel() returns an in-process LocalChannel shaped like pika's BlockingChannel
+  (basic_publish, basic_consume, start_consuming, basic_ack, ...), with no sockets.
+- FakeAmqpServer speaks the AMQP wire protocol on 127.0.0.1, so unmodified pika and
+  aio-pika clients (ConfirmingPublisher, start_consumer, AsyncOrderEvents) work
+  against RABBIT_URL=server.url.
+
+Nothing is persisted; "durable" is accepted and reported, but state ends with the process.
+
+    python benchmarks/fake_amqp.py --port 5673 --confirm-delay 0.005 --nack-rate 0.01
+"""
+import argparse
+import itertools
+import logging
+import queue
+import random
+import socket
+import socketserver
+import threading
+import time
+from collections import deque, namedtuple
+from dataclasses import dataclass
+
+import pika
+from pika import frame, spec
+
+logger = logging.getLogger(__name__)
+
+Deliver = namedtuple("Deliver", "consumer_tag delivery_tag redelivered exchange routing_key")
+
+NOT_FOUND = 404
+PRECONDITION_FAILED = 406
+COMMAND_INVALID = 503
+
+
+class ChannelError(Exception):
+    """A soft error that closes the channel, like a RabbitMQ channel exception"""
+
+    def __init__(self, reply_code, reply_text):
+        super().__init__(reply_text)
+        self.reply_code = reply_code
+        self.reply_text = reply_text
+
+
+@dataclass
+class Faults:
+    """Failures and latency to inject; change the fields at any time"""
+
+    confirm_delay: float = 0.0  # seconds before a publish is confirmed
+    deliver_delay: float = 0.0  # seconds before each delivery to a consumer
+    nack_rate: float = 0.0  # fraction of publishes nacked instead of acked (and not routed)
+    drop_rate: float = 0.0  # fraction of publishes acked but silently dropped
+    disconnect_after: int = 0  # close a connection after this many publishes on it (0 = never)
+    seed: int = None
+
+    def __post_init__(self):
+        self.random = random.Random(self.seed)
+
+    def roll(self, rate):
+        return rate > 0 and self.random.random() < rate
+
+
+class Message:
+    __slots__ = ("exchange", "routing_key", "properties", "body", "redelivered", "enqueued_at")
+
+    def __init__(self, exchange, routing_key, properties, body, redelivered=False):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.properties = properties or pika.BasicProperties()
+        self.body = body
+        self.redelivered = redelivered
+        self.enqueued_at = time.monotonic()
+
+
+class Queue:
+    def __init__(self, name, durable=True, arguments=None):
+        self.name = name
+        self.durable = durable
+        self.arguments = dict(arguments or {})
+        self.messages = deque()
+        self.consumers = []
+        self.ttl = self.arguments.get("x-message-ttl")
+        self.dead_letter_exchange = self.arguments.get("x-dead-letter-exchange")
+        self.dead_letter_routing_key = self.arguments.get("x-dead-letter-routing-key")
+        self._rotation = 0
+
+    def next_consumer(self):
+        """Round-robin over consumers whose channel has prefetch capacity left"""
+        for offset in range(len(self.consumers)):
+            consumer = self.consumers[(self._rotation + offset) % len(self.consumers)]
+            if consumer.channel.has_capacity():
+                self._rotation = (self._rotation + offset + 1) % len(self.consumers)
+                return consumer
+        return None
+
+
+Consumer = namedtuple("Consumer", "tag queue channel no_ack")
+
+
+class Broker:
+    """Exchanges, queues and routing; every method is thread-safe"""
+
+    def __init__(self, faults=None, ttl_check_interval=0.05):
+        self.faults = faults or Faults()
+        self.exchanges = {"": "direct"}
+        self.bindings = {"": []}  # exchange -> [(queue name, routing key)]
+        self.queues = {}
+        self.lock = threading.RLock()
+        self._names = itertools.count(1)
+        self._closed = threading.Event()
+        self._sweeper = threading.Thread(
+            target=self._expire_loop, args=(ttl_check_interval,), name="fake-amqp-ttl", daemon=True
+        )
+        self._sweeper.start()
+
+    def close(self):
+        self._closed.set()
+
+    def channel(self):
+        return LocalChannel(self)
+
+    # Topology
+
+    def exchange_declare(self, exchange, exchange_type="direct", durable=True, passive=False):
+        with self.lock:
+            existing = self.exchanges.get(exchange)
+            if existing is None:
+                if passive:
+                    raise ChannelError(NOT_FOUND, f"NOT_FOUND - no exchange '{exchange}'")
+                self.exchanges[exchange] = exchange_type
+                self.bindings[exchange] = []
+            elif not passive and existing != exchange_type:
+                raise ChannelError(PRECONDITION_FAILED, f"PRECONDITION_FAILED - inequivalent type for '{exchange}'")
+
+    def exchange_delete(self, exchange):
+        with self.lock:
+            self.exchanges.pop(exchange, None)
+            self.bindings.pop(exchange, None)
+
+    def queue_declare(self, queue_name="", durable=True, arguments=None, passive=False):
+        """Returns (queue name, message count, consumer count)"""
+        with self.lock:
+            if not queue_name:
+                queue_name = f"amq.gen-{next(self._names)}"
+            existing = self.queues.get(queue_name)
+            if existing is None:
+                if passive:
+                    raise ChannelError(NOT_FOUND, f"NOT_FOUND - no queue '{queue_name}'")
+                existing = self.queues[queue_name] = Queue(queue_name, durable, arguments)
+            return queue_name, len(existing.messages), len(existing.consumers)
+
+    def queue_bind(self, queue_name, exchange, routing_key=""):
+        with self.lock:
+            if exchange not in self.exchanges:
+                raise ChannelError(NOT_FOUND, f"NOT_FOUND - no exchange '{exchange}'")
+            if queue_name not in self.queues:
+                raise ChannelError(NOT_FOUND, f"NOT_FOUND - no queue '{queue_name}'")
+            if (queue_name, routing_key) not in self.bindings[exchange]:
+                self.bindings[exchange].append((queue_name, routing_key))
+
+    def queue_purge(self, queue_name):
+        with self.lock:
+            purged = len(self._queue(queue_name).messages)
+            self._queue(queue_name).messages.clear()
+            return purged
+
+    def queue_delete(self, queue_name):
+        with self.lock:
+            deleted = self.queues.pop(queue_name, None)
+            for bindings in self.bindings.values():
+                bindings[:] = [binding for binding in bindings if binding[0] != queue_name]
+            return 0 if deleted is None else len(deleted.messages)
+
+    def _queue(self, queue_name):
+        try:
+            return self.queues[queue_name]
+        except KeyError:
+            raise ChannelError(NOT_FOUND, f"NOT_FOUND - no queue '{queue_name}'") from None
+
+    def depth(self, queue_name):
+        """Messages ready in a queue, not counting deliveries awaiting acks"""
+        with self.lock:
+            return len(self._queue(queue_name).messages)
+
+    # Messages
+
+    def publish(self, exchange, routing_key, body, properties=None):
+        """Route a message; returns the number of queues it reached"""
+        with self.lock:
+            exchange_type = self.exchanges.get(exchange)
+            if exchange_type is None:
+                raise ChannelError(NOT_FOUND, f"NOT_FOUND - no exchange '{exchange}'")
+            if exchange == "":
+                targets = [routing_key] if routing_key in self.queues else []
+            elif exchange_type == "fanout":
+                targets = [queue_name for queue_name, _ in self.bindings[exchange]]
+            else:
+                targets = [queue_name for queue_name, key in self.bindings[exchange] if key == routing_key]
+            for queue_name in dict.fromkeys(targets):
+                self._enqueue(self.queues[queue_name], Message(exchange, routing_key, properties, body))
+            return len(targets)
+
+    def _enqueue(self, target, message, front=False):
+        if front:
+            target.messages.appendleft(message)
+        else:
+            target.messages.append(message)
+        self._dispatch(target)
+
+    def _dispatch(self, target):
+        while target.messages:
+            consumer = target.next_consumer()
+            if consumer is None:
+                return
+            message = target.messages.popleft()
+            consumer.channel.deliver(consumer, message)
+
+    def consume(self, channel, queue_name, consumer_tag, no_ack=False):
+        with self.lock:
+            target = self._queue(queue_name)
+            consumer = Consumer(consumer_tag, target, channel, no_ack)
+            target.consumers.append(consumer)
+            self._dispatch(target)
+            return consumer
+
+    def cancel(self, consumer):
+        with self.lock:
+            if consumer in consumer.queue.consumers:
+                consumer.queue.consumers.remove(consumer)
+
+    def get(self, queue_name):
+        """Pop one ready message, or None (basic.get)"""
+        with self.lock:
+            target = self._queue(queue_name)
+            return (target, target.messages.popleft()) if target.messages else (target, None)
+
+    def requeue(self, target, message):
+        with self.lock:
+            message.redelivered = True
+            if target.name in self.queues:
+                self._enqueue(target, message, front=True)
+
+    def redispatch(self):
+        """Offer ready messages to consumers again after a channel freed prefetch capacity"""
+        with self.lock:
+            for target in self.queues.values():
+                if target.messages and target.consumers:
+                    self._dispatch(target)
+
+    def _expire_loop(self, interval):
+        while not self._closed.wait(interval):
+            now = time.monotonic()
+            with self.lock:
+                for target in list(self.queues.values()):
+                    if target.ttl is None:
+                        continue
+                    while target.messages and now - target.messages[0].enqueued_at >= target.ttl / 1000:
+                        self._dead_letter(target, target.messages.popleft(), "expired")
+
+    def _dead_letter(self, source, message, reason):
+        if source.dead_letter_exchange is None or source.dead_letter_exchange not in self.exchanges:
+            return
+        properties = message.properties
+        headers = dict(properties.headers or {})
+        headers["x-death"] = [{"queue": source.name, "reason": reason, "count": 1, "exchange": message.exchange}]
+        republished = pika.BasicProperties(
+            content_type=properties.content_type,
+            content_encoding=properties.content_encoding,
+            headers=headers,
+            delivery_mode=properties.delivery_mode,
+            message_id=properties.message_id,
+        )
+        routing_key = source.dead_letter_routing_key or message.routing_key
+        self.publish(source.dead_letter_exchange, routing_key, message.body, republished)
+
+
+class BrokerChannel:
+    """Broker-side state of one channel: prefetch, consumers and unacked deliveries"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.prefetch_count = 0
+        self.consumers = {}  # consumer tag -> Consumer
+        self.unacked = {}  # delivery tag -> (queue, message)
+        self.confirming = False
+        self.publish_seq = 0
+        self._delivery_tags = itertools.count(1)
+        self._consumer_tags = itertools.count(1)
+
+    def has_capacity(self):
+        return not self.prefetch_count or len(self.unacked) < self.prefetch_count
+
+    def deliver(self, consumer, message):
+        """Hand a message to the client; called with the broker lock held"""
+        delivery_tag = next(self._delivery_tags)
+        if not consumer.no_ack:
+            self.unacked[delivery_tag] = (consumer.queue, message)
+        self.send_delivery(consumer.tag, delivery_tag, message)
+
+    def send_delivery(self, consumer_tag, delivery_tag, message):
+        raise NotImplementedError
+
+    def qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+        self.broker.redispatch()
+
+    def consume(self, queue_name, consumer_tag=None, no_ack=False):
+        consumer_tag = consumer_tag or f"ctag-{id(self)}.{next(self._consumer_tags)}"
+        with self.broker.lock:
+            self.consumers[consumer_tag] = None
+            self.consumers[consumer_tag] = self.broker.consume(self, queue_name, consumer_tag, no_ack)
+        return consumer_tag
+
+    def cancel(self, consumer_tag):
+        consumer = self.consumers.pop(consumer_tag, None)
+        if consumer is not None:
+            self.broker.cancel(consumer)
+
+    def _settled(self, delivery_tag, multiple):
+        if multiple:
+            return [tag for tag in self.unacked if delivery_tag == 0 or tag <= delivery_tag]
+        if delivery_tag not in self.unacked:
+            raise ChannelError(PRECONDITION_FAILED, f"PRECONDITION_FAILED - unknown delivery tag {delivery_tag}")
+        return [delivery_tag]
+
+    def ack(self, delivery_tag, multiple=False):
+        with self.broker.lock:
+            for tag in self._settled(delivery_tag, multiple):
+                del self.unacked[tag]
+            self.broker.redispatch()
+
+    def nack(self, delivery_tag, multiple=False, requeue=True):
+        with self.broker.lock:
+            for tag in self._settled(delivery_tag, multiple):
+                target, message = self.unacked.pop(tag)
+                if requeue:
+                    self.broker.requeue(target, message)
+                else:
+                    self.broker._dead_letter(target, message, "rejected")
+            self.broker.redispatch()
+
+    def publish(self, exchange, routing_key, body, properties):
+        """Route a publish, applying injected faults; returns True to ack, False to nack"""
+        faults = self.broker.faults
+        if faults.roll(faults.nack_rate):
+            return False
+        if not faults.roll(faults.drop_rate):
+            self.broker.publish(exchange, routing_key, body, properties)
+        return True
+
+    def close(self):
+        """Cancel consumers and requeue unacked deliveries, as when a channel closes"""
+        with self.broker.lock:
+            for consumer_tag in list(self.consumers):
+                self.cancel(consumer_tag)
+            unacked, self.unacked = self.unacked, {}
+            # Requeued at the front newest first, so the original order is kept
+            for _, (target, message) in sorted(unacked.items(), key=lambda item: item[0], reverse=True):
+                self.broker.requeue(target, message)
+
+
+class LocalChannel(BrokerChannel):
+    """In-process channel with the blocking API of pika's BlockingChannel
+
+    Deliveries are queued and handed to consumer callbacks by start_consuming() or
+    process_data_events() on the calling thread. Publishing raises
+    pika.exceptions.NackError when the broker nacks, as a confirm-mode channel does.
+    """
+
+    def __init__(self, broker):
+        super().__init__(broker)
+        self.is_open = True
+        self._callbacks = {}
+        self._pending = deque()
+        self._ready = threading.Condition()
+        self._stopped = False
+
+    def send_delivery(self, consumer_tag, delivery_tag, message):
+        with self._ready:
+            self._pending.append((consumer_tag, delivery_tag, message))
+            self._ready.notify()
+
+    def basic_qos(self, prefetch_count=0, prefetch_size=0, global_qos=False):
+        self.qos(prefetch_count)
+
+    def confirm_delivery(self):
+        self.confirming = True
+
+    def exchange_declare(self, exchange, exchange_type="direct", durable=True, passive=False, **_):
+        self.broker.exchange_declare(exchange, exchange_type, durable, passive)
+
+    def queue_declare(self, queue="", durable=True, arguments=None, passive=False, **_):
+        return self.broker.queue_declare(queue, durable, arguments, passive)
+
+    def queue_bind(self, queue, exchange, routing_key=""):
+        self.broker.queue_bind(queue, exchange, routing_key)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.broker.faults.confirm_delay and self.confirming:
+            time.sleep(self.broker.faults.confirm_delay)
+        if not self.publish(exchange, routing_key, body, properties) and self.confirming:
+            raise pika.exceptions.NackError([body])
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, consumer_tag=None):
+        consumer_tag = consumer_tag or f"ctag-local.{next(self._consumer_tags)}"
+        self._callbacks[consumer_tag] = on_message_callback
+        return self.consume(queue, consumer_tag, no_ack=auto_ack)
+
+    def basic_cancel(self, consumer_tag):
+        self.cancel(consumer_tag)
+        self._callbacks.pop(consumer_tag, None)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.ack(delivery_tag, multiple)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.nack(delivery_tag, multiple, requeue)
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.nack(delivery_tag, False, requeue)
+
+    def process_data_events(self, time_limit=0):
+        """Run callbacks for the deliveries waiting now, blocking up to time_limit for one"""
+        deadline = time.monotonic() + (time_limit or 0)
+        with self._ready:
+            while not self._pending and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            batch, self._pending = self._pending, deque()
+        for consumer_tag, delivery_tag, message in batch:
+            if self.broker.faults.deliver_delay:
+                time.sleep(self.broker.faults.deliver_delay)
+            callback = self._callbacks.get(consumer_tag)
+            if callback is not None:
+                method = Deliver(consumer_tag, delivery_tag, message.redelivered, message.exchange, message.routing_key)
+                callback(self, method, message.properties, message.body)
+
+    def start_consuming(self):
+        self._stopped = False
+        while not self._stopped:
+            self.process_data_events(time_limit=0.1)
+
+    def stop_consuming(self):
+        with self._ready:
+            self._stopped = True
+            self._ready.notify_all()
+
+    def close(self):
+        self.is_open = False
+        self.stop_consuming()
+        super().close()
+
+
+class _WireChannel(BrokerChannel):
+    def __init__(self, broker, connection, number):
+        super().__init__(broker)
+        self.connection = connection
+        self.number = number
+        self.pending_publish = None  # [Basic.Publish, properties, body size, fragments]
+
+    def send_delivery(self, consumer_tag, delivery_tag, message):
+        deliver = spec.Basic.Deliver(
+            consumer_tag, delivery_tag, message.redelivered, message.exchange, message.routing_key
+        )
+        self.connection.send_content(self.number, deliver, message.properties, message.body)
+
+
+class _AmqpConnection(socketserver.BaseRequestHandler):
+    """One client connection: a reader loop here plus writes from any thread"""
+
+    FRAME_MAX = 131072
+
+    def setup(self):
+        self.broker = self.server.broker
+        self.channels = {}
+        self.frame_max = self.FRAME_MAX
+        self.heartbeat = 0
+        self.publishes = 0
+        self.closing = False
+        self._write_lock = threading.Lock()
+        self._confirms = queue.Queue()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.connections.add(self)
+
+    def finish(self):
+        self.server.connections.discard(self)
+        self._confirms.put(None)
+        for channel in list(self.channels.values()):
+            channel.close()
+        self.channels.clear()
+
+    # Writing
+
+    def send(self, *frames):
+        data = b"".join(f.marshal() for f in frames)
+        with self._write_lock:
+            try:
+                self.request.sendall(data)
+            except OSError:
+                self.closing = True
+
+    def send_method(self, channel_number, method):
+        self.send(frame.Method(channel_number, method))
+
+    def send_content(self, channel_number, method, properties, body):
+        frames = [frame.Method(channel_number, method), frame.Header(channel_number, len(body), properties)]
+        chunk = self.frame_max - 8
+        for start in range(0, len(body), chunk):
+            frames.append(frame.Body(channel_number, body[start : start + chunk]))
+        if self.broker.faults.deliver_delay:
+            time.sleep(self.broker.faults.deliver_delay)
+        self.send(*frames)
+
+    def disconnect(self, reply_code=320, reply_text="CONNECTION_FORCED - broker forced connection closure"):
+        """Close the connection from the broker side, like a RabbitMQ restart"""
+        self.closing = True
+        self.send_method(0, spec.Connection.Close(reply_code, reply_text, 0, 0))
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # Reading
+
+    def handle(self):
+        threading.Thread(target=self._confirm_loop, name="fake-amqp-confirms", daemon=True).start()
+        buffer = b""
+        while not self.closing:
+            try:
+                data = self.request.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while buffer:
+                consumed, received = frame.decode_frame(buffer)
+                if not consumed:
+                    break
+                buffer = buffer[consumed:]
+                try:
+                    self._on_frame(received)
+                except ChannelError as e:
+                    self._close_channel(received.channel_number, e)
+
+    def _on_frame(self, received):
+        if isinstance(received, frame.ProtocolHeader):
+            properties = {
+                "product": "fake-amqp",
+                "capabilities": {
+                    "publisher_confirms": True,
+                    "basic.nack": True,
+                    "consumer_cancel_notify": True,
+                    "per_consumer_qos": True,
+                    "authentication_failure_close": True,
+                    "connection.blocked": False,
+                },
+            }
+            self.send_method(0, spec.Connection.Start(server_properties=properties, mechanisms="PLAIN AMQPLAIN"))
+        elif isinstance(received, frame.Heartbeat):
+            self.send(frame.Heartbeat())
+        elif isinstance(received, frame.Method):
+            self._on_method(received.channel_number, received.method)
+        elif isinstance(received, frame.Header):
+            pending = self.channels[received.channel_number].pending_publish
+            pending[1], pending[2] = received.properties, received.body_size
+            if received.body_size == 0:
+                self._publish(received.channel_number)
+        elif isinstance(received, frame.Body):
+            pending = self.channels[received.channel_number].pending_publish
+            pending[3].append(received.fragment)
+            if sum(len(fragment) for fragment in pending[3]) >= pending[2]:
+                self._publish(received.channel_number)
+
+    def _on_method(self, number, method):
+        channel = self.channels.get(number)
+        if isinstance(method, spec.Connection.StartOk):
+            self.send_method(0, spec.Connection.Tune(channel_max=2047, frame_max=self.FRAME_MAX, heartbeat=0))
+        elif isinstance(method, spec.Connection.TuneOk):
+            self.frame_max = method.frame_max or self.FRAME_MAX
+            self.heartbeat = method.heartbeat
+            if self.heartbeat:
+                threading.Thread(target=self._heartbeat_loop, name="fake-amqp-heartbeat", daemon=True).start()
+        elif isinstance(method, spec.Connection.Open):
+            self.send_method(0, spec.Connection.OpenOk())
+        elif isinstance(method, spec.Connection.Close):
+            self.send_method(0, spec.Connection.CloseOk())
+            self.closing = True
+        elif isinstance(method, spec.Connection.CloseOk):
+            self.closing = True
+        elif isinstance(method, spec.Channel.Open):
+            self.channels[number] = _WireChannel(self.broker, self, number)
+            self.send_method(number, spec.Channel.OpenOk())
+        elif isinstance(method, spec.Channel.Close):
+            if channel is not None:
+                channel.close()
+                self.channels.pop(number, None)
+            self.send_method(number, spec.Channel.CloseOk())
+        elif isinstance(method, spec.Channel.CloseOk):
+            self.channels.pop(number, None)
+        elif channel is None:
+            return  # methods racing a channel close are discarded, as RabbitMQ does
+        elif isinstance(method, spec.Confirm.Select):
+            channel.confirming = True
+            if not method.nowait:
+                self.send_method(number, spec.Confirm.SelectOk())
+        elif isinstance(method, spec.Exchange.Declare):
+            self.broker.exchange_declare(method.exchange, method.type, method.durable, method.passive)
+            if not method.nowait:
+                self.send_method(number, spec.Exchange.DeclareOk())
+        elif isinstance(method, spec.Exchange.Delete):
+            self.broker.exchange_delete(method.exchange)
+            if not method.nowait:
+                self.send_method(number, spec.Exchange.DeleteOk())
+        elif isinstance(method, spec.Queue.Declare):
+            name, messages, consumers = self.broker.queue_declare(
+                method.queue, method.durable, method.arguments, method.passive
+            )
+            if not method.nowait:
+                self.send_method(number, spec.Queue.DeclareOk(name, messages, consumers))
+        elif isinstance(method, spec.Queue.Bind):
+            self.broker.queue_bind(method.queue, method.exchange, method.routing_key)
+            if not method.nowait:
+                self.send_method(number, spec.Queue.BindOk())
+        elif isinstance(method, spec.Queue.Purge):
+            purged = self.broker.queue_purge(method.queue)
+            if not method.nowait:
+                self.send_method(number, spec.Queue.PurgeOk(purged))
+        elif isinstance(method, spec.Queue.Delete):
+            deleted = self.broker.queue_delete(method.queue)
+            if not method.nowait:
+                self.send_method(number, spec.Queue.DeleteOk(deleted))
+        elif isinstance(method, spec.Basic.Qos):
+            self.send_method(number, spec.Basic.QosOk())
+            channel.qos(method.prefetch_count)
+        elif isinstance(method, spec.Basic.Consume):
+            consumer_tag = method.consumer_tag or None
+            with self.broker.lock:
+                # ConsumeOk must reach the client before the first Deliver
+                consumer_tag = consumer_tag or f"ctag-{number}.{next(channel._consumer_tags)}"
+                if not method.nowait:
+                    self.broker._queue(method.queue)
+                    self.send_method(number, spec.Basic.ConsumeOk(consumer_tag))
+                channel.consume(method.queue, consumer_tag, no_ack=method.no_ack)
+        elif isinstance(method, spec.Basic.Cancel):
+            channel.cancel(method.consumer_tag)
+            if not method.nowait:
+                self.send_method(number, spec.Basic.CancelOk(method.consumer_tag))
+        elif isinstance(method, spec.Basic.Publish):
+            channel.pending_publish = [method, None, 0, []]
+        elif isinstance(method, spec.Basic.Get):
+            target, message = self.broker.get(method.queue)
+            if message is None:
+                self.send_method(number, spec.Basic.GetEmpty())
+            else:
+                with self.broker.lock:
+                    delivery_tag = next(channel._delivery_tags)
+                    if not method.no_ack:
+                        channel.unacked[delivery_tag] = (target, message)
+                    get_ok = spec.Basic.GetOk(
+                        delivery_tag, message.redelivered, message.exchange, message.routing_key, len(target.messages)
+                    )
+                self.send_content(number, get_ok, message.properties, message.body)
+        elif isinstance(method, spec.Basic.Ack):
+            channel.ack(method.delivery_tag, method.multiple)
+        elif isinstance(method, spec.Basic.Nack):
+            channel.nack(method.delivery_tag, method.multiple, method.requeue)
+        elif isinstance(method, spec.Basic.Reject):
+            channel.nack(method.delivery_tag, False, method.requeue)
+        elif isinstance(method, spec.Basic.Recover):
+            channel.close()
+            self.send_method(number, spec.Basic.RecoverOk())
+        else:
+            raise ChannelError(COMMAND_INVALID, f"COMMAND_INVALID - {method.NAME} is not supported")
+
+    def _publish(self, number):
+        channel = self.channels[number]
+        method, properties, _, fragments = channel.pending_publish
+        channel.pending_publish = None
+        ack = channel.publish(method.exchange, method.routing_key, b"".join(fragments), properties)
+        if channel.confirming:
+            channel.publish_seq += 1
+            confirm = spec.Basic.Ack(channel.publish_seq) if ack else spec.Basic.Nack(channel.publish_seq)
+            delay = self.broker.faults.confirm_delay
+            if delay:
+                self._confirms.put((time.monotonic() + delay, number, confirm))
+            else:
+                self.send_method(number, confirm)
+
+        self.publishes += 1
+        limit = self.broker.faults.disconnect_after
+        if limit and self.publishes >= limit:
+            self.disconnect()
+
+    def _close_channel(self, number, error):
+        channel = self.channels.pop(number, None)
+        if channel is not None:
+            channel.close()
+        self.send_method(number, spec.Channel.Close(error.reply_code, error.reply_text, 0, 0))
+
+    def _confirm_loop(self):
+        """Sends delayed confirms in publish order"""
+        while True:
+            item = self._confirms.get()
+            if item is None:
+                return
+            due, number, confirm = item
+            time.sleep(max(0.0, due - time.monotonic()))
+            if number in self.channels:
+                self.send_method(number, confirm)
+
+    def _heartbeat_loop(self):
+        while not self.closing:
+            time.sleep(self.heartbeat / 2)
+            self.send(frame.Heartbeat())
+
+
+class FakeAmqpServer(socketserver.ThreadingTCPServer):
+    """Serves a Broker over AMQP 0-9-1 on localhost; any credentials are accepted"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, broker=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _AmqpConnection)
+        self.broker = broker or Broker()
+        self.connections = set()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"amqp://guest:guest@{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-amqp", daemon=True)
+        self._thread.start()
+        return self
+
+    def disconnect_all(self):
+        """Force-close every client connection, simulating a broker restart"""
+        for connection in list(self.connections):
+            connection.disconnect()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        self.disconnect_all()
+        self.broker.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5673)
+    parser.add_argument("--confirm-delay", type=float, default=0.0, help="seconds")
+    parser.add_argument("--deliver-delay", type=float, default=0.0, help="seconds")
+    parser.add_argument("--nack-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-after", type=int, default=0, help="publishes per connection")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    faults = Faults(
+        confirm_delay=args.confirm_delay,
+        deliver_delay=args.deliver_delay,
+        nack_rate=args.nack_rate,
+        drop_rate=args.drop_rate,
+        disconnect_after=args.disconnect_after,
+        seed=args.seed,
+    )
+    logging.basicConfig(level=logging.INFO)
+    server = FakeAmqpServer(Broker(faults), args.host, args.port)
+    logger.info(f"Fake AMQP broker listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
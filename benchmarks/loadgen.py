@@ -0,0 +1,140 @@
+# benchmarks/loadgen.py
+"""HTTP load generator reporting latency percentiles and requests per second
+
+Each of --concurrency threads keeps one keep-alive connection open and sends requests
+back to back, for --duration seconds or until --requests have been sent in total.
+"{id}" in the URL or body is replaced with a random integer from --id-range.
+
+    python benchmarks/loadgen.py http://localhost:8000/orders/{id} --id-range 1:1000 -c 32 -d 30
+    python benchmarks/loadgen.py http://localhost:8000/orders -X POST \\
+        --body '{"user_id": 1, "product_id": 2, "quantity": 1}' -c 16 -n 5000
+"""
+import argparse
+import http.client
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from common import print_table, summarize, write_results
+
+
+class Worker(threading.Thread):
+    def __init__(self, args, deadline, budget, seed):
+        super().__init__(daemon=True)
+        self.args = args
+        self.deadline = deadline
+        self.budget = budget
+        self.rng = random.Random(seed)
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def _connect(self, target):
+        connection_class = http.client.HTTPSConnection if target.scheme == "https" else http.client.HTTPConnection
+        return connection_class(target.netloc, timeout=self.args.timeout)
+
+    def run(self):
+        target = urlsplit(self.args.url)
+        low, high = self.args.id_range
+        headers = dict(self.args.header)
+        if self.args.body is not None:
+            headers.setdefault("Content-Type", "application/json")
+        connection = self._connect(target)
+
+        while time.perf_counter() < self.deadline and self.budget.take():
+            value = str(self.rng.randint(low, high))
+            path = ((target.path or "/") + (f"?{target.query}" if target.query else "")).replace("{id}", value)
+            body = None if self.args.body is None else self.args.body.replace("{id}", value).encode()
+            started = time.perf_counter()
+            try:
+                connection.request(self.args.method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.errors[type(e).__name__] += 1
+                connection.close()
+                connection = self._connect(target)
+                continue
+            self.latencies.append(time.perf_counter() - started)
+            self.statuses[response.status] += 1
+            if response.getheader("Connection", "").lower() == "close":
+                connection.close()
+                connection = self._connect(target)
+        connection.close()
+
+
+class RequestBudget:
+    """Shared countdown of requests still to send; unlimited when total is None"""
+
+    def __init__(self, total):
+        self.remaining = total
+        self._lock = threading.Lock()
+
+    def take(self):
+        if self.remaining is None:
+            return True
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def parse_header(value):
+    name, _, header_value = value.partition(":")
+    return name.strip(), header_value.strip()
+
+
+def parse_id_range(value):
+    low, _, high = value.partition(":")
+    return int(low), int(high or low)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("-X", "--method", default="GET")
+    parser.add_argument("--body", help="request body; {id} is substituted like in the URL")
+    parser.add_argument("-H", "--header", action="append", type=parse_header, default=[], help="'Name: value'")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("-n", "--requests", type=int, help="stop after this many requests in total")
+    parser.add_argument("--id-range", type=parse_id_range, default=(1, 1), help="LOW:HIGH for {id}")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    budget = RequestBudget(args.requests)
+    started = time.perf_counter()
+    workers = [Worker(args, started + args.duration, budget, args.seed + i) for i in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker in workers for latency in worker.latencies]
+    statuses = sum((worker.statuses for worker in workers), Counter())
+    errors = sum((worker.errors for worker in workers), Counter())
+    result = {
+        "url": args.url,
+        "method": args.method,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        **summarize(latencies, elapsed),
+        "status_codes": {str(status): count for status, count in sorted(statuses.items())},
+        "errors": dict(errors),
+    }
+    result["requests_per_sec"] = result.pop("ops_per_sec")
+
+    print_table([result], ["count", "p50_ms", "p95_ms", "p99_ms", "max_ms", "requests_per_sec"])
+    print(f"Status codes: {result['status_codes']}  Errors: {result['errors'] or 'none'}")
+    path = write_results("loadgen", [result], args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
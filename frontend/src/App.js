@@ -332,21 +332,21 @@ function App() {
         cash: "Cash on Delivery",
       };
 
-      // Create orders for all items in cart
-      for (const item of cart) {
-        await fetch(`${API_BASES.orders}/orders`, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({
+      // Create orders for all items in cart in one request
+      await fetch(`${API_BASES.orders}/orders/batch`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(
+          cart.map((item) => ({
             user_id: defaultUser.id,
             product_id: item.id,
             quantity: item.quantity,
             payment_method: selectedPaymentMethod,
             amount: item.price * item.quantity,
             status: "pending",
-          }),
-        });
-      }
+          }))
+        ),
+      });
 
       // Create payment record
       await fetch(`${API_BASES.payments}/payments`, {
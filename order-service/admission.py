@@ -0,0 +1,232 @@
+# order-service/admission.py
+"""Admission control for order creation
+
+Requests are admitted in three steps:
+
+1. Pressure check. Pressure rises from 0 to 1 as the outbox depth, the relay's publish
+   latency or the consumer queue depth moves from its soft to its hard limit. At 1 the
+   system is saturated and requests get 503 at once.
+2. Per-user token bucket. A user over their rate gets 429.
+3. Global concurrency limit. The limit shrinks as pressure rises, so in-flight work
+   backs off before the queues are full.
+
+Both rejections carry Retry-After. All state is per process; with several gunicorn
+workers the effective limits are multiplied by the worker count.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import pika
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Rejected(Exception):
+    """Raised by AdmissionController.admit(); status is 429 or 503"""
+
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Token buckets keyed by user, refilled at `rate` per second up to `burst`
+
+    Only the `max_keys` most recently seen keys are kept; an evicted key starts again
+    with a full bucket. A request costing more than `burst` is admitted from a full
+    bucket and still charged in full, leaving the bucket in debt until the refill pays
+    it back.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, key, tokens=1):
+        """Take tokens; returns 0 if they were available, else seconds until they will be"""
+        needed = min(tokens, self.burst)
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= needed:
+                bucket[0] -= tokens
+                return 0.0
+            return (needed - bucket[0]) / self.rate
+
+    def give_back(self, key, tokens=1):
+        """Return tokens taken for a request that was rejected later on"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + tokens)
+
+
+class Signal:
+    """One saturation signal read through `read()`, mapped to 0..1 between soft and hard
+
+    `read` returns the current value, or None when it is unknown; an unknown signal
+    exerts no pressure.
+    """
+
+    def __init__(self, name, read, soft, hard):
+        self.name = name
+        self.read = read
+        self.soft = soft
+        self.hard = hard
+
+    def pressure(self):
+        try:
+            value = self.read()
+        except Exception:
+            return 0.0
+        if value is None or value <= self.soft:
+            return 0.0
+        if value >= self.hard or self.hard <= self.soft:
+            return 1.0
+        return (value - self.soft) / (self.hard - self.soft)
+
+
+class AdmissionController:
+    """Admits or rejects requests from the pressure of `signals`, per-user rates and concurrency"""
+
+    def __init__(
+        self, signals, max_concurrency=64, user_rate=5.0, user_burst=10, retry_after=1, max_retry_after=30
+    ):
+        self.signals = list(signals)
+        self.max_concurrency = max_concurrency
+        self.users = TokenBucket(user_rate, user_burst)
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def pressure(self):
+        """(pressure, name of the signal exerting it) for the most saturated signal"""
+        pressure, name = 0.0, None
+        for signal in self.signals:
+            value = signal.pressure()
+            if value > pressure:
+                pressure, name = value, signal.name
+        metrics.ADMISSION_PRESSURE.set(pressure)
+        return pressure, name
+
+    def concurrency_limit(self, pressure):
+        return max(1, math.floor(self.max_concurrency * (1 - pressure)))
+
+    def _retry_after(self, pressure):
+        # Back clients off harder the more saturated we are, to avoid synchronized retry storms
+        return min(self.max_retry_after, max(self.retry_after, math.ceil(self.max_retry_after * pressure**2)))
+
+    def _reject(self, status, retry_after, reason):
+        metrics.ADMISSION_REJECTIONS.labels(reason).inc()
+        raise Rejected(status, retry_after, reason)
+
+    def admit(self, user_key, cost=1):
+        """Take a concurrency slot, released by leaving the returned context manager
+
+        Raises Rejected instead of queueing the request.
+        """
+        pressure, signal = self.pressure()
+        if pressure >= 1:
+            self._reject(503, self._retry_after(pressure), f"saturated:{signal}")
+
+        wait = self.users.take(user_key, cost)
+        if wait:
+            self._reject(429, min(self.max_retry_after, math.ceil(wait)), "user_rate")
+
+        with self._lock:
+            if self._in_flight >= self.concurrency_limit(pressure):
+                admitted = False
+            else:
+                admitted = True
+                self._in_flight += 1
+        if not admitted:
+            self.users.give_back(user_key, cost)
+            self._reject(503, self._retry_after(pressure), "concurrency")
+        return _Slot(self)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+
+class _Slot:
+    __slots__ = ("_controller",)
+
+    def __init__(self, controller):
+        self._controller = controller
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._controller._release()
+
+
+class QueueDepthProbe(threading.Thread):
+    """Polls the ready message count of downstream queues with passive declares
+
+    `depth` is the largest count across `queues`, or None while RabbitMQ is unreachable.
+    """
+
+    def __init__(self, url, queues, interval=5):
+        super().__init__(name="queue-depth-probe", daemon=True)
+        self.url = url
+        self.queues = list(queues)
+        self.interval = interval
+        self.depth = None
+        self._stopping = threading.Event()
+
+    def close(self):
+        self._stopping.set()
+        self.join(self.interval)
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self._poll()
+            except Exception as e:
+                logger.warning("Queue depth probe disconnected: %s", e, extra={"event": "queue_probe_disconnected"})
+            self.depth = None
+            self._stopping.wait(self.interval)
+
+    def _poll(self):
+        connection = pika.BlockingConnection(pika.URLParameters(self.url))
+        try:
+            channel = connection.channel()
+            while not self._stopping.is_set():
+                depths = []
+                for queue in self.queues:
+                    try:
+                        depths.append(channel.queue_declare(queue, passive=True).method.message_count)
+                    except pika.exceptions.ChannelClosedByBroker:
+                        # Not declared yet: no consumer has started, so nothing is waiting on it
+                        channel = connection.channel()
+                self.depth = max(depths, default=0)
+                connection.sleep(self.interval)
+        finally:
+            if connection.is_open:
+                connection.close()
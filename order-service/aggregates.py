@@ -0,0 +1,210 @@
+# order-service/aggregates.py
+"""Windowed aggregates over the order event stream
+
+Consumers hand every processed order to OrderAggregator.add(), which only appends its
+fields to columnar micro-batch buffers. Once per flush interval the buffers are swapped
+out and reduced a column at a time into fixed panes of PANE_SECONDS. Tumbling
+per-minute windows and sliding windows over the last 1, 5 and 15 minutes are then
+merged from the panes, so no per-window state is kept per order.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import compress
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PANE_SECONDS = 10
+TUMBLING_SECONDS = 60
+SLIDING_WINDOWS = {"1m": 60, "5m": 300, "15m": 900}
+RETENTION_SECONDS = max(SLIDING_WINDOWS.values())
+TOP_PRODUCTS = 10
+# Distinct payment methods reported by name; the rest are summed under "other"
+MAX_PAYMENT_METHODS = 20
+
+
+class Pane:
+    __slots__ = ("orders", "revenue", "products")
+
+    def __init__(self):
+        self.orders = 0
+        self.revenue = Counter()  # payment_method -> amount
+        self.products = Counter()  # product_id -> orders
+
+
+def _amount(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return float(value)
+    return 0.0
+
+
+class OrderAggregator:
+    """Orders per minute, revenue by payment_method and top product_ids over time windows
+
+    Windows use arrival time at the consumer rather than created_at, so they track the
+    live stream; a replayed backlog is counted when it is consumed.
+    """
+
+    def __init__(self, pane_seconds=PANE_SECONDS, retention=RETENTION_SECONDS, clock=time.time):
+        self.pane_seconds = pane_seconds
+        self.retention_panes = math.ceil(retention / pane_seconds)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._new_batch()
+        # pane index (arrival time // pane_seconds) -> Pane, guarded by _panes_lock
+        self._panes = {}
+        self._panes_lock = threading.Lock()
+
+    def _new_batch(self):
+        self._times = array("d")
+        self._amounts = array("d")
+        self._methods = []
+        self._products = []
+
+    def add(self, order):
+        """Buffer one processed order; O(1) and safe to call from any thread"""
+        method = order.get("payment_method")
+        product_id = order.get("product_id")
+        with self._lock:
+            # Read under the lock, so each batch's arrival times are in ascending order
+            self._times.append(self.clock())
+            self._amounts.append(_amount(order.get("amount")))
+            self._methods.append(method if isinstance(method, str) and method else "unknown")
+            self._products.append(product_id if isinstance(product_id, (int, str)) else None)
+
+    def flush(self):
+        """Reduce the buffered micro-batch into panes; returns the number of orders reduced"""
+        with self._lock:
+            times, amounts, methods, products = self._times, self._amounts, self._methods, self._products
+            self._new_batch()
+        if not times:
+            return 0
+
+        # Arrival times are sorted, so a batch splits into a few runs of one pane each
+        reduced = []
+        start = 0
+        while start < len(times):
+            pane = int(times[start] // self.pane_seconds)
+            end = max(start + 1, bisect.bisect_left(times, (pane + 1) * self.pane_seconds, lo=start))
+            reduced.append((pane, self._reduce(amounts[start:end], methods[start:end], products[start:end])))
+            start = end
+
+        with self._panes_lock:
+            for index, partial in reduced:
+                pane = self._panes.setdefault(index, Pane())
+                pane.orders += partial.orders
+                pane.revenue.update(partial.revenue)
+                pane.products.update(partial.products)
+            oldest = int(self.clock() // self.pane_seconds) - self.retention_panes
+            for index in [index for index in self._panes if index <= oldest]:
+                del self._panes[index]
+        return len(times)
+
+    @staticmethod
+    def _reduce(amounts, methods, products):
+        """Aggregate one run of columns; each reduction is a C-level pass over a column"""
+        pane = Pane()
+        pane.orders = len(amounts)
+        pane.products = Counter(products)
+        pane.products.pop(None, None)
+        for method in set(methods):
+            pane.revenue[method] = math.fsum(compress(amounts, map(method.__eq__, methods)))
+        return pane
+
+    def _merge(self, first_pane, last_pane):
+        merged = Pane()
+        with self._panes_lock:
+            for index, pane in self._panes.items():
+                if first_pane <= index <= last_pane:
+                    merged.orders += pane.orders
+                    merged.revenue.update(pane.revenue)
+                    merged.products.update(pane.products)
+        return merged
+
+    def sliding(self, seconds):
+        """Totals over the last `seconds`, sliding one pane at a time"""
+        current = int(self.clock() // self.pane_seconds)
+        return self._merge(current - math.ceil(seconds / self.pane_seconds) + 1, current)
+
+    def tumbling(self, seconds=TUMBLING_SECONDS):
+        """(window start, totals) for each aligned window still within retention, oldest first"""
+        panes_per_window = max(1, seconds // self.pane_seconds)
+        with self._panes_lock:
+            starts = sorted({index - index % panes_per_window for index in self._panes})
+        return [(start * self.pane_seconds, self._merge(start, start + panes_per_window - 1)) for start in starts]
+
+    def snapshot(self):
+        """JSON-ready view of the sliding and tumbling windows"""
+        windows = {}
+        for name, seconds in SLIDING_WINDOWS.items():
+            pane = self.sliding(seconds)
+            windows[name] = {
+                "orders": pane.orders,
+                "orders_per_minute": round(pane.orders * 60 / seconds, 3),
+                "revenue_by_payment_method": _limit_methods(pane.revenue),
+                "top_products": [
+                    {"product_id": product_id, "orders": orders}
+                    for product_id, orders in pane.products.most_common(TOP_PRODUCTS)
+                ],
+            }
+        minutes = [
+            {
+                "start": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+                "orders": pane.orders,
+                "revenue_by_payment_method": _limit_methods(pane.revenue),
+            }
+            for start, pane in self.tumbling()
+        ]
+        return {"generated_at": datetime.now(timezone.utc).isoformat(), "windows": windows, "minutes": minutes}
+
+    def export_metrics(self):
+        """Set the order_stream_* gauges from the sliding windows"""
+        # Payment methods and top products change over time; drop series that fell out
+        metrics.ORDER_STREAM_REVENUE.clear()
+        metrics.ORDER_STREAM_TOP_PRODUCT_ORDERS.clear()
+        for name, seconds in SLIDING_WINDOWS.items():
+            pane = self.sliding(seconds)
+            metrics.ORDER_STREAM_ORDERS.labels(name).set(pane.orders)
+            for method, revenue in _limit_methods(pane.revenue).items():
+                metrics.ORDER_STREAM_REVENUE.labels(name, method).set(revenue)
+        for product_id, orders in self.sliding(SLIDING_WINDOWS["5m"]).products.most_common(TOP_PRODUCTS):
+            metrics.ORDER_STREAM_TOP_PRODUCT_ORDERS.labels(str(product_id)).set(orders)
+
+
+def _limit_methods(revenue):
+    """Revenue keyed by at most MAX_PAYMENT_METHODS names, keeping label cardinality bounded"""
+    limited = {}
+    for method, amount in revenue.most_common():
+        key = str(method) if len(limited) < MAX_PAYMENT_METHODS else "other"
+        limited[key] = round(limited.get(key, 0.0) + amount, 2)
+    return limited
+
+
+class AggregationFlusher(threading.Thread):
+    """Flushes an OrderAggregator and refreshes its gauges every `interval` seconds"""
+
+    def __init__(self, aggregator, interval=1.0):
+        super().__init__(name="order-aggregation", daemon=True)
+        self.aggregator = aggregator
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.aggregator.flush()
+                self.aggregator.export_metrics()
+            except Exception as e:
+                logger.error("Order aggregation flush failed: %s", e, extra={"event": "aggregation_flush_failed"})
+
+    def close(self):
+        self._stopped.set()
+        self.join()
+        self.aggregator.flush()
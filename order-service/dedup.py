@@ -0,0 +1,79 @@
+# order-service/dedup.py
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class DedupCache:
+    """Remembers recently processed message ids so redeliveries can be skipped
+
+    The in-memory layer is an LRU bounded to `max_entries`, and every entry expires after
+    `ttl` seconds. When `path` is given, ids are also written to SQLite, so a restarted
+    consumer still recognises messages it processed before the restart.
+    """
+
+    # Purge expired rows from SQLite once every this many additions
+    PURGE_EVERY = 10000
+
+    def __init__(self, max_entries=100000, ttl=3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # message id -> expires_at
+        self._lock = threading.Lock()
+        self._db = None
+        self._adds = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS processed (message_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def seen(self, key):
+        """True if `key` was added within the last `ttl` seconds"""
+        now = time.time()
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is not None:
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return True
+                del self._entries[key]
+
+            if self._db is None:
+                return False
+            row = self._db.execute("SELECT expires_at FROM processed WHERE message_id = ?", (key,)).fetchone()
+            if row is None or row[0] <= now:
+                return False
+            self._remember(key, row[0])
+            return True
+
+    def add(self, key):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO processed (message_id, expires_at) VALUES (?, ?)", (key, expires_at)
+            )
+            self._adds += 1
+            if self._adds % self.PURGE_EVERY == 0:
+                self._db.execute("DELETE FROM processed WHERE expires_at <= ?", (time.time(),))
+
+    def _remember(self, key, expires_at):
+        self._entries[key] = expires_at
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,257 @@
+# order-service/event_publisher.py
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import pika
+
+from messaging import ORDER_EVENTS_EXCHANGE, ORDER_EVENTS_EXCHANGE_TYPE, topology
+
+logger = logging.getLogger(__name__)
+
+
+class PublisherBackpressure(Exception):
+    """Raised by publish() when the outgoing queue is full and callers should shed load"""
+
+
+class PublishNacked(Exception):
+    """Set on a message future when the broker rejected the message"""
+
+
+class PublishInterrupted(Exception):
+    """Set on a message future when the connection dropped before the broker confirmed it"""
+
+
+class ConfirmingPublisher(threading.Thread):
+    """Publishes to one exchange from a dedicated thread, with publisher confirms
+
+    Request threads only call publish(), which puts the message on a bounded queue and
+    returns a Future. This thread owns the pika SelectConnection (pika connections are not
+    thread-safe), writes queued messages in batches without waiting for a round-trip per
+    message, and resolves the futures as broker acks arrive, including multiple-acks that
+    confirm a whole group of delivery tags at once.
+    """
+
+    def __init__(
+        self,
+        url,
+        exchange=ORDER_EVENTS_EXCHANGE,
+        exchange_type=ORDER_EVENTS_EXCHANGE_TYPE,
+        max_queue=10000,
+        batch_size=100,
+        max_in_flight=1000,
+        reconnect_delay=5,
+    ):
+        super().__init__(name=f"publisher-{exchange}", daemon=True)
+        self.url = url
+        self.exchange = exchange
+        self.exchange_type = exchange_type
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.reconnect_delay = reconnect_delay
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        # delivery_tag -> Future for messages written but not yet confirmed; tags are
+        # assigned in increasing order, so dict order is tag order
+        self._unconfirmed = {}
+        self._delivery_tag = 0
+        self._connection = None
+        self._channel = None
+        self._wakeup_pending = False
+        self._stopping = False
+
+    @property
+    def ready(self):
+        """True while a confirm-mode channel is open"""
+        return self._channel is not None
+
+    @property
+    def backlog(self):
+        """Messages queued or written but not yet confirmed"""
+        return self._queue.qsize() + len(self._unconfirmed)
+
+    @property
+    def saturated(self):
+        return self._queue.full()
+
+    def publish(self, body, properties=None, routing_key=""):
+        """Queue a message and return a Future that resolves once the broker confirms it
+
+        Raises PublisherBackpressure instead of blocking when the queue is full.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((routing_key, body, properties, future))
+        except queue.Full:
+            raise PublisherBackpressure(f"Publish queue for '{self.exchange}' is full") from None
+        self._wake()
+        return future
+
+    def close(self, timeout=5):
+        """Flush queued messages for up to `timeout` seconds, then close the connection"""
+        self._stopping = True
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._close_when_flushed)
+            except Exception:
+                pass
+        self.join(timeout)
+        self._fail_unconfirmed(PublishInterrupted("Publisher closed"))
+        while True:
+            try:
+                _, _, _, future = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_exception(PublishInterrupted("Publisher closed before sending"))
+
+    def run(self):
+        while not self._stopping:
+            self._connection = pika.SelectConnection(
+                pika.URLParameters(self.url),
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_open_error,
+                on_close_callback=self._on_connection_closed,
+            )
+            self._connection.ioloop.start()
+            self._connection = None
+            if not self._stopping:
+                logger.info(
+                    "Publisher reconnecting in %s seconds...",
+                    self.reconnect_delay,
+                    extra={"event": "publisher_reconnecting"},
+                )
+                time.sleep(self.reconnect_delay)
+
+    # Everything below runs on the publisher thread's ioloop
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error):
+        logger.error("Publisher failed to connect to RabbitMQ: %s", error, extra={"event": "publisher_connect_failed"})
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        self._channel = None
+        self._fail_unconfirmed(PublishInterrupted(f"Connection closed: {reason}"))
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        channel.add_on_close_callback(self._on_channel_closed)
+        if topology.is_declared("exchange", self.exchange):
+            self._on_exchange_declared(channel)
+            return
+        channel.exchange_declare(
+            exchange=self.exchange,
+            exchange_type=self.exchange_type,
+            durable=True,
+            callback=lambda _frame: self._on_exchange_declared(channel),
+        )
+
+    def _on_exchange_declared(self, channel):
+        topology.mark_declared("exchange", self.exchange)
+        channel.confirm_delivery(
+            self._on_delivery_confirmation,
+            callback=lambda _frame: self._on_confirm_mode(channel),
+        )
+
+    def _on_confirm_mode(self, channel):
+        self._channel = channel
+        self._delivery_tag = 0
+        # A wakeup scheduled on a previous connection's ioloop will never run
+        self._wakeup_pending = False
+        logger.info(
+            "Publisher ready on exchange '%s' with confirms enabled",
+            self.exchange,
+            extra={"event": "publisher_ready", "exchange": self.exchange},
+        )
+        self._drain()
+
+    def _on_channel_closed(self, channel, reason):
+        logger.error("Publisher channel closed: %s", reason, extra={"event": "publisher_channel_closed"})
+        if isinstance(reason, pika.exceptions.ChannelClosedByBroker) and reason.reply_code == 404:
+            topology.forget()
+        self._channel = None
+        self._fail_unconfirmed(PublishInterrupted(f"Channel closed: {reason}"))
+        if self._connection is not None and not self._connection.is_closing and not self._connection.is_closed:
+            self._connection.close()
+
+    def _wake(self):
+        # Coalesce wakeups: one pending drain callback is enough for any number of publishes
+        if self._wakeup_pending:
+            return
+        connection = self._connection
+        if connection is None:
+            return
+        self._wakeup_pending = True
+        try:
+            connection.ioloop.add_callback_threadsafe(self._drain)
+        except Exception:
+            self._wakeup_pending = False
+
+    def _drain(self):
+        self._wakeup_pending = False
+        channel = self._channel
+        if channel is None or not channel.is_open:
+            return
+
+        sent = 0
+        while sent < self.batch_size and len(self._unconfirmed) < self.max_in_flight:
+            try:
+                routing_key, body, properties, future = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                channel.basic_publish(self.exchange, routing_key, body, properties)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            self._delivery_tag += 1
+            self._unconfirmed[self._delivery_tag] = future
+            sent += 1
+
+        # Batch written; let the ioloop flush it and read confirms before the next batch
+        if not self._queue.empty() and len(self._unconfirmed) < self.max_in_flight:
+            self._wakeup_pending = True
+            self._connection.ioloop.call_later(0, self._drain)
+
+    def _on_delivery_confirmation(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = list(itertools.takewhile(lambda tag: tag <= method.delivery_tag, self._unconfirmed))
+        else:
+            tags = [method.delivery_tag]
+
+        for tag in tags:
+            future = self._unconfirmed.pop(tag, None)
+            if future is None:
+                continue
+            if acked:
+                future.set_result(tag)
+            else:
+                future.set_exception(PublishNacked(f"Broker nacked delivery tag {tag}"))
+
+        if not self._wakeup_pending and not self._queue.empty():
+            self._drain()
+
+    def _fail_unconfirmed(self, error):
+        unconfirmed, self._unconfirmed = self._unconfirmed, {}
+        for future in unconfirmed.values():
+            future.set_exception(error)
+
+    def _close_when_flushed(self):
+        connection = self._connection
+        if connection is None or connection.is_closing or connection.is_closed:
+            return
+        if self._channel is not None and (not self._queue.empty() or self._unconfirmed):
+            connection.ioloop.call_later(0.05, self._close_when_flushed)
+            return
+        connection.close()
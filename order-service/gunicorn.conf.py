@@ -0,0 +1,67 @@
+# order-service/gunicorn.conf.py
+# Production serving settings; every value can be overridden through the environment.
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', 3003)}"
+
+# Without ORDER_STORE_URL orders live in each worker's memory, so the default is one
+# worker per pod with a thread pool sized to the available cores. With a shared database
+# every worker sees the same orders and the default scales with the cores instead.
+workers = int(
+    os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1 if os.getenv("ORDER_STORE_URL") else 1)
+)
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", multiprocessing.cpu_count() * 4))
+
+# Import the app once in the master and fork it into workers. Safe because RabbitMQ
+# connections, publisher threads and the outbox are only created in post_worker_init.
+# Not with ORDER_JOURNAL_DIR: a replacement worker must recover the orders from disk,
+# not inherit the master's copy from startup.
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true" and not os.getenv("ORDER_JOURNAL_DIR")
+
+# Keep idle upstream connections open longer than Kong's 60s keepalive, so Kong never
+# reuses a connection the worker has just closed
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 75))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+accesslog = None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# Each worker keeps its own metric values and response cache; when there is more than
+# one, aggregate the metrics and share cache invalidations
+if workers > 1:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="prometheus-"))
+    # Workers share one table of invalidation stamps, so a write in one worker evicts the
+    # cached response in all of them
+    os.environ.setdefault(
+        "RESPONSE_CACHE_SHARED_PATH",
+        os.path.join(tempfile.mkdtemp(prefix="response-cache-"), "invalidations"),
+    )
+
+
+def post_worker_init(worker):
+    # After the fork: each worker opens its own RabbitMQ connection and relay thread
+    from app import setup_rabbitmq
+
+    setup_rabbitmq()
+
+
+def worker_exit(server, worker):
+    # Flush in-flight order events before the worker goes away, then snapshot the orders
+    # so the replacement worker starts without replaying the log
+    from app import close_rabbitmq, orders
+
+    close_rabbitmq()
+    if hasattr(orders, "close_journal"):
+        orders.close_journal()
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
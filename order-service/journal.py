@@ -0,0 +1,348 @@
+# order-service/journal.py
+# Original of user-service/journal.py; scripts/sync_shared_modules.py copies it there.
+"""Write-ahead log and snapshots that make an in-memory store survive restarts
+
+A Journal is a directory of log segments and snapshots:
+
+    wal-0000000007.log        records appended since snapshot 7, oldest first
+    snapshot-0000000007.json  the whole store as of the start of segment 7
+
+The store appends one record per change before applying it to memory. With
+sync="always" the writer then waits until the record is on disk. Writers that arrive
+during an fsync share the next one (group commit), so the number of fsyncs per second
+stays flat as concurrency grows. sync="interval" fsyncs in the background every
+`sync_interval` seconds, and sync="off" leaves flushing to the OS. Every record is
+written to the OS immediately, so a process crash loses nothing in any mode; the modes
+differ only in what a power loss or kernel crash can take.
+
+Every `snapshot_records` records, or `snapshot_interval` seconds after the first change,
+the store's checkpoint() starts a new segment, copies its state and writes the snapshot
+in the background. Once the snapshot is on disk, older segments and snapshots are
+deleted. Startup loads the newest snapshot and replays only the segments after it.
+
+One process owns the directory at a time. A second one waits up to `lock_timeout`
+seconds for it to exit and then fails with JournalLocked. Open the journal in the
+process that serves the store, not in a parent that forks it.
+"""
+import contextlib
+import fcntl
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+import serialization
+
+logger = logging.getLogger(__name__)
+
+# Each record is framed as (payload length, CRC-32 of payload) followed by the payload
+_FRAME = struct.Struct("<II")
+_SNAPSHOT_MAGIC = b"SNP1"
+_SNAPSHOT_HEADER = struct.Struct("<4sI")
+
+SYNC_MODES = ("always", "interval", "off")
+
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+
+class JournalError(Exception):
+    """The journal directory cannot be used"""
+
+
+class JournalLocked(JournalError):
+    """Another process already has the journal open"""
+
+
+class JournalCorrupt(JournalError):
+    """A snapshot or a log segment other than the newest one failed its checksum"""
+
+
+def _segment_name(generation):
+    return f"wal-{generation:010d}.log"
+
+
+def _snapshot_name(generation):
+    return f"snapshot-{generation:010d}.json"
+
+
+def _generation(name, prefix, suffix):
+    if name.startswith(prefix) and name.endswith(suffix):
+        try:
+            return int(name[len(prefix) : -len(suffix)])
+        except ValueError:
+            return None
+    return None
+
+
+def _read_records(path, last):
+    """Yield the payloads in one segment; a torn tail is cut off if this is the newest segment"""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        end = offset + _FRAME.size
+        if end <= len(data):
+            length, checksum = _FRAME.unpack_from(data, offset)
+            payload = data[end : end + length]
+            if len(payload) == length and zlib.crc32(payload) == checksum:
+                yield payload
+                offset = end + length
+                continue
+        if not last:
+            raise JournalCorrupt(f"{path} is damaged at byte {offset}")
+        # A crash mid-write leaves a partial record at the end of the newest segment
+        logger.warning("Discarding %d bytes of incomplete record at the end of %s", len(data) - offset, path)
+        with open(path, "r+b") as f:
+            f.truncate(offset)
+        return
+
+
+class Journal:
+    """Append-only log of store changes with group-commit fsync, snapshots and truncation"""
+
+    def __init__(
+        self,
+        directory,
+        sync="always",
+        sync_interval=1.0,
+        snapshot_records=100000,
+        snapshot_interval=300.0,
+        lock_timeout=30.0,
+    ):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync must be one of {', '.join(SYNC_MODES)}, not {sync!r}")
+        self.directory = directory
+        self.sync = sync
+        self.sync_interval = sync_interval
+        self.snapshot_records = snapshot_records
+        self.snapshot_interval = snapshot_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "LOCK"), "a")
+        # A replacement gunicorn worker may start before the one it replaces has exited
+        deadline = time.monotonic() + lock_timeout
+        while True:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    self._lock_file.close()
+                    raise JournalLocked(f"{directory} is in use by another process") from None
+                time.sleep(0.1)
+
+        # Order: a store's lock, then _sync_lock, then _lock
+        self._lock = threading.Lock()  # appends and segment switches
+        self._sync_lock = threading.Lock()  # one fsync at a time; writers queue here
+        self._fd = None
+        self._generation = None
+        self._written = 0  # records handed to the OS
+        self._synced = 0  # records known to be on disk
+        self._since_snapshot = 0
+        self._first_change_at = None
+        self._checkpoint = None
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._threads = []
+        self.fsyncs = 0
+        self.records = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _listing(self, prefix, suffix):
+        found = (_generation(name, prefix, suffix) for name in os.listdir(self.directory))
+        return sorted(generation for generation in found if generation is not None)
+
+    def recover(self):
+        """Return (snapshot state or None, iterator of records logged after it)
+
+        Call once, before start(). The iterator must be exhausted before start() opens
+        the next segment.
+        """
+        for name in os.listdir(self.directory):
+            # Left by a crash while a snapshot was being written, or by a run with no changes
+            if name.endswith(".tmp") or (name.startswith("wal-") and not os.path.getsize(self._path(name))):
+                os.remove(self._path(name))
+        snapshots = self._listing("snapshot-", ".json")
+        segments = self._listing("wal-", ".log")
+        state, base = None, 0
+        if snapshots:
+            base = snapshots[-1]
+            with open(self._path(_snapshot_name(base)), "rb") as f:
+                data = f.read()
+            magic, checksum = _SNAPSHOT_HEADER.unpack_from(data)
+            body = memoryview(data)[_SNAPSHOT_HEADER.size :]
+            if magic != _SNAPSHOT_MAGIC or zlib.crc32(body) != checksum:
+                raise JournalCorrupt(f"{_snapshot_name(base)} failed its checksum")
+            state = serialization.loads(body)
+        replay = [generation for generation in segments if generation >= base]
+        self._generation = max([base - 1, *segments])
+
+        def records():
+            for position, generation in enumerate(replay):
+                for payload in _read_records(self._path(_segment_name(generation)), position == len(replay) - 1):
+                    yield serialization.loads(payload)
+
+        return state, records()
+
+    def start(self, checkpoint):
+        """Open a fresh segment and start the background sync and snapshot threads
+
+        `checkpoint` is called with no arguments when a snapshot is due; it should call
+        rotate() and write_snapshot(), as OrderStore.checkpoint() does.
+        """
+        self._checkpoint = checkpoint
+        with self._lock:
+            self._open_segment()
+        self._start_threads()
+
+    def _open_segment(self):
+        self._generation += 1
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_CLOEXEC", 0)
+        self._fd = os.open(self._path(_segment_name(self._generation)), flags, 0o644)
+        self._fsync_directory()
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _start_threads(self):
+        self._threads = [threading.Thread(target=self._run_checkpoints, name="journal-snapshots", daemon=True)]
+        if self.sync == "interval":
+            self._threads.append(threading.Thread(target=self._run_syncs, name="journal-sync", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def append(self, record):
+        """Write a record to the log; returns the ticket to pass to wait()
+
+        Called under the store's lock, so records are logged in the order they are applied.
+        """
+        payload = serialization.dumps(record)
+        frame = _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            os.write(self._fd, frame)
+            self._written += 1
+            ticket = self._written
+            self.records += 1
+            self._since_snapshot += 1
+            if self._first_change_at is None:
+                self._first_change_at = time.monotonic()
+            due = self._since_snapshot == self.snapshot_records
+        if due:
+            self._wake.set()
+        return ticket
+
+    def wait(self, ticket):
+        """With sync="always", block until the record behind `ticket` is on disk"""
+        if self.sync == "always" and ticket:
+            self._sync_to(ticket)
+
+    def _sync_to(self, ticket):
+        with self._sync_lock:
+            # The fsync another writer finished while this one queued may already cover it
+            if self._synced >= ticket:
+                return
+            with self._lock:
+                target = self._written
+                fd = self._fd
+            _datasync(fd)
+            self._synced = target
+            self.fsyncs += 1
+
+    def sync_now(self):
+        """Force everything written so far to disk"""
+        self._sync_to(self._written)
+
+    def rotate(self):
+        """Start a new segment and return the generation a snapshot taken now belongs to
+
+        Call under the store's lock together with copying its state, so the snapshot
+        contains exactly the records in the segments before the new one.
+        """
+        with self._sync_lock, self._lock:
+            _datasync(self._fd)
+            os.close(self._fd)
+            self._synced = self._written
+            self._since_snapshot = 0
+            self._first_change_at = None
+            self._open_segment()
+            return self._generation
+
+    def write_snapshot(self, generation, state):
+        """Persist `state` as the snapshot for `generation` and drop what it supersedes"""
+        body = serialization.dumps(state)
+        temporary = self._path(_snapshot_name(generation) + ".tmp")
+        with open(temporary, "wb") as f:
+            f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, zlib.crc32(body)))
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._path(_snapshot_name(generation)))
+        self._fsync_directory()
+
+        # A concurrent checkpoint may be deleting the same files
+        for old in self._listing("wal-", ".log"):
+            if old < generation:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(_segment_name(old)))
+        for old in self._listing("snapshot-", ".json"):
+            if old < generation:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._path(_snapshot_name(old)))
+        logger.info("Wrote snapshot %d (%d bytes)", generation, len(body), extra={"event": "journal_snapshot"})
+
+    def _snapshot_due(self):
+        if self._since_snapshot >= self.snapshot_records:
+            return True
+        started = self._first_change_at
+        return started is not None and time.monotonic() - started >= self.snapshot_interval
+
+    def _run_checkpoints(self):
+        while not self._closed.is_set():
+            self._wake.wait(timeout=min(self.snapshot_interval, 1.0))
+            self._wake.clear()
+            if self._closed.is_set() or not self._snapshot_due():
+                continue
+            try:
+                self._checkpoint()
+            except Exception:
+                # The log still holds every change; the next attempt will pick it up
+                logger.exception("Journal snapshot failed")
+
+    def _run_syncs(self):
+        while not self._closed.wait(self.sync_interval):
+            try:
+                self.sync_now()
+            except OSError:
+                logger.exception("Journal fsync failed")
+
+    def close(self):
+        """Stop the background threads, write a final snapshot and release the directory
+
+        The snapshot covers everything logged since the previous one, so the next start
+        replays nothing.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wake.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        if self._fd is not None:
+            if self._since_snapshot and self._checkpoint is not None:
+                try:
+                    self._checkpoint()
+                except Exception:
+                    logger.exception("Final journal snapshot failed; the log will be replayed on the next start")
+            self.sync_now()
+            os.close(self._fd)
+            self._fd = None
+        self._lock_file.close()
@@ -0,0 +1,146 @@
+# order-service/logging_config.py
+"""Non-blocking JSON logging for the order service and its consumers
+
+configure_logging() sends every record through a QueueHandler. Request and consumer
+threads therefore only filter the record and put it on a queue. A QueueListener
+thread formats it and writes it to stdout. Messages use %-style arguments, so a record
+that is filtered or sampled away is never formatted.
+
+High-volume events are sampled. Pass extra={"event": name} with one of the names in
+LOG_SAMPLED_EVENTS, and only one in LOG_SAMPLE_EVERY of those records is kept; each
+kept record notes the rate in "sampled". Warnings and errors are always kept.
+
+    LOG_LEVEL=INFO LOG_FORMAT=json LOG_SAMPLE_EVERY=10 \\
+    LOG_SAMPLED_EVENTS=order_recorded,order_received,order_processed
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", 10))
+LOG_SAMPLED_EVENTS = [
+    event
+    for event in os.getenv("LOG_SAMPLED_EVENTS", "order_recorded,order_received,order_processed").split(",")
+    if event
+]
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, any `extra` fields and exc"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in `every` records of each sampled event below WARNING"""
+
+    def __init__(self, every, events):
+        super().__init__()
+        self.every = every
+        self.events = set(events)
+        self._counters = defaultdict(itertools.count)
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        if self.every <= 1 or event not in self.events or record.levelno >= logging.WARNING:
+            return True
+        # next() on itertools.count is atomic under the GIL, so no lock is needed
+        if next(self._counters[event]) % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records unformatted; the listener thread does the formatting
+
+    The stock QueueHandler merges the message and its arguments in the calling thread.
+    Arguments are formatted when the listener reaches the record, normally within
+    milliseconds. Log copies of objects that may change before then.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+_lock = threading.Lock()
+
+
+def _start_listener(handler):
+    global _listener
+    _listener = logging.handlers.QueueListener(handler.queue, *_output_handlers(), respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_in_child(handler):
+    global _lock
+    _lock = threading.Lock()
+    handler.queue = queue.SimpleQueue()
+    _start_listener(handler)
+
+
+def _output_handlers():
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    return [output]
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def configure_logging(level=None):
+    """Route the root logger through the queue; safe to call more than once"""
+    with _lock:
+        root = logging.getLogger()
+        root.setLevel(level or LOG_LEVEL)
+        if _listener is not None:
+            return
+
+        handler = _LazyQueueHandler(queue.SimpleQueue())
+        handler.addFilter(SamplingFilter(LOG_SAMPLE_EVERY, LOG_SAMPLED_EVENTS))
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        _start_listener(handler)
+        atexit.register(stop_logging)
+        # The listener thread does not survive fork(); gunicorn workers and consumer pool
+        # processes each start their own, on a fresh queue so records still waiting in
+        # the parent's are not written twice
+        os.register_at_fork(after_in_child=lambda: _restart_in_child(handler))
@@ -0,0 +1,117 @@
+# order-service/metrics.py
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Same name and labels as payment-service's prom-client histogram, so the Grafana
+# latency dashboards cover the Python services too
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Duration of HTTP requests in seconds",
+    ["method", "route", "status_code"],
+)
+
+EVENT_PUBLISH_DURATION = Histogram(
+    "order_event_publish_duration_seconds",
+    "Time from handing a batch of order events to the publisher until RabbitMQ confirms it",
+)
+
+# Every worker relays from the same outbox file, so report the largest recent count
+OUTBOX_DEPTH = Gauge(
+    "order_outbox_depth",
+    "Order events recorded in the outbox and not yet confirmed by RabbitMQ",
+    multiprocess_mode="max",
+)
+
+SERVICE_CLIENT_DURATION = Histogram(
+    "order_service_client_request_seconds",
+    "Duration of lookups from order-service to user-service and product-service",
+    ["resource", "outcome"],
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "order_admission_rejections_total",
+    "POST /orders requests turned away by admission control, by reason",
+    ["reason"],
+)
+
+ADMISSION_PRESSURE = Gauge(
+    "order_admission_pressure",
+    "Saturation from 0 to 1 driving admission control; 1 rejects every new order",
+    multiprocess_mode="max",
+)
+
+CONSUMER_PROCESSING_DURATION = Histogram(
+    "order_consumer_processing_seconds",
+    "Time from dispatching an order event to the worker pool until its handler finished",
+    ["outcome"],
+)
+
+
+# Sliding-window aggregates of the order event stream, refreshed by the consumer
+ORDER_STREAM_ORDERS = Gauge(
+    "order_stream_orders",
+    "Order events consumed within the sliding window",
+    ["window"],
+)
+
+ORDER_STREAM_REVENUE = Gauge(
+    "order_stream_revenue",
+    "Order amount consumed within the sliding window, by payment method",
+    ["window", "payment_method"],
+)
+
+ORDER_STREAM_TOP_PRODUCT_ORDERS = Gauge(
+    "order_stream_top_product_orders",
+    "Order events in the last 5 minutes for the most ordered products",
+    ["product_id"],
+)
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "http_response_cache_lookups_total",
+    "Lookups in the cached GET responses, by whether the body was served from the cache",
+    ["result"],
+)
+
+
+def collect():
+    """Exposition text for this process, or for all gunicorn workers in multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_app(app):
+    """Time every request into HTTP_REQUEST_DURATION and serve GET /metrics"""
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            # The URL rule, not the raw path, keeps label cardinality bounded
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            HTTP_REQUEST_DURATION.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(collect(), mimetype=CONTENT_TYPE_LATEST)
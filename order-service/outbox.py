@@ -0,0 +1,269 @@
+# order-service/outbox.py
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import wait
+
+import metrics
+from event_publisher import PublisherBackpressure
+from messaging import JsonSerializer, message_properties
+
+logger = logging.getLogger(__name__)
+
+OutboxEntry = namedtuple("OutboxEntry", "id message_id routing_key body content_type attempts event_type")
+
+
+class Outbox:
+    """Durable SQLite table of events waiting to be relayed to one RabbitMQ exchange
+
+    Events are written here in the request path instead of going straight to the broker.
+    Each event carries a message_id that stays the same across retries, so consumers
+    can drop the duplicates an at-least-once relay will occasionally produce.
+    """
+
+    def __init__(self, path, synchronous="NORMAL"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA synchronous={synchronous}")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message_id TEXT NOT NULL UNIQUE,
+                    routing_key TEXT NOT NULL DEFAULT '',
+                    body BLOB NOT NULL,
+                    content_type TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    event_type TEXT
+                )
+                """
+            )
+            # Outboxes created before events had types
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+            if "event_type" not in columns:
+                self._conn.execute("ALTER TABLE outbox ADD COLUMN event_type TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at)")
+            self._depth = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def __len__(self):
+        """Number of events not yet confirmed by the broker"""
+        return self._depth
+
+    def append(self, message_id, body, routing_key="", content_type=JsonSerializer.content_type, event_type=None):
+        """Record an event; returns False if an event with this message_id is already pending"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(message_id, routing_key, body, content_type, event_type, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (message_id, routing_key, body, content_type, event_type, time.time()),
+            )
+            self._depth += cursor.rowcount
+            return cursor.rowcount == 1
+
+    def append_many(self, events):
+        """Record (message_id, body, routing_key, content_type, event_type) tuples in one transaction
+
+        Either every event is recorded or none is. Returns how many were new; events
+        whose message_id is already pending are skipped.
+        """
+        now = time.time()
+        rows = [
+            (message_id, routing_key, body, content_type, event_type, now)
+            for message_id, body, routing_key, content_type, event_type in events
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.executemany(
+                    "INSERT OR IGNORE INTO outbox "
+                    "(message_id, routing_key, body, content_type, event_type, next_attempt_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._depth += cursor.rowcount
+            return cursor.rowcount
+
+    def claim(self, limit, lease=30):
+        """Lease the oldest due events to the caller for `lease` seconds
+
+        Several workers may relay from the same outbox file; leasing keeps them from
+        publishing the same events concurrently, and an event whose relay died becomes
+        due again once its lease runs out.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE outbox SET next_attempt_at = ? WHERE id IN "
+                "(SELECT id FROM outbox WHERE next_attempt_at <= ? ORDER BY id LIMIT ?) "
+                "RETURNING id, message_id, routing_key, body, content_type, attempts, event_type",
+                (now + lease, now, limit),
+            ).fetchall()
+        # RETURNING does not guarantee an order
+        rows.sort()
+        return [OutboxEntry(*row) for row in rows]
+
+    def refresh_depth(self):
+        """Recount pending events, including those written by other processes"""
+        with self._lock:
+            self._depth = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        return self._depth
+
+    def mark_published(self, entry_ids):
+        if not entry_ids:
+            return
+        with self._lock:
+            cursor = self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in entry_ids])
+            self._depth -= cursor.rowcount
+
+    def mark_failed(self, entries, retry_at):
+        """Schedule a retry for (entry_id, attempts) pairs at retry_at(attempts)"""
+        if not entries:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ? WHERE id = ?",
+                [(retry_at(attempts), entry_id) for entry_id, attempts in entries],
+            )
+
+    def release(self, entry_ids):
+        """Return leased events that were never sent, making them due again immediately"""
+        if not entry_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET next_attempt_at = ? WHERE id = ?", [(time.time(), i) for i in entry_ids]
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxRelay(threading.Thread):
+    """Drains the outbox to RabbitMQ in batches through a ConfirmingPublisher
+
+    An event is deleted from the outbox only after the broker confirms it. Nacked,
+    interrupted or unconfirmed events are retried with exponential backoff.
+    """
+
+    LATENCY_STALE_AFTER = 30
+
+    def __init__(
+        self,
+        outbox,
+        publisher,
+        batch_size=500,
+        confirm_timeout=10,
+        poll_interval=1,
+        base_backoff=0.5,
+        max_backoff=60,
+    ):
+        super().__init__(name="outbox-relay", daemon=True)
+        self.outbox = outbox
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.confirm_timeout = confirm_timeout
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._depth_refreshed = 0
+        self._latency = None
+        self._latency_at = 0.0
+
+    @property
+    def publish_latency(self):
+        """Moving average of seconds from handing a batch to the publisher to its confirms
+
+        None when no batch was relayed in the last `LATENCY_STALE_AFTER` seconds, so an
+        idle relay does not keep reporting an old outage.
+        """
+        if time.monotonic() - self._latency_at > self.LATENCY_STALE_AFTER:
+            return None
+        return self._latency
+
+    def notify(self):
+        """Wake the relay after new events were appended"""
+        self._wakeup.set()
+
+    def close(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        self.join(timeout)
+
+    def _retry_at(self, attempts):
+        return time.time() + min(self.max_backoff, self.base_backoff * 2**attempts)
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            if time.monotonic() - self._depth_refreshed >= 1:
+                metrics.OUTBOX_DEPTH.set(self.outbox.refresh_depth())
+                self._depth_refreshed = time.monotonic()
+            # The lease outlasts a full confirm wait, so claimed events are not picked up twice
+            batch = self.outbox.claim(self.batch_size, lease=self.confirm_timeout * 3)
+            if not batch:
+                self._wakeup.wait(self.poll_interval)
+                continue
+            try:
+                self.relay(batch)
+            except Exception as e:
+                logger.error("Outbox relay error: %s", e, extra={"event": "outbox_relay_error"})
+                self._stopping.wait(self.poll_interval)
+
+    def relay(self, batch):
+        """Publish one batch and record which events the broker confirmed"""
+        started = time.perf_counter()
+        futures = {}
+        for entry in batch:
+            try:
+                futures[entry] = self.publisher.publish(
+                    entry.body,
+                    properties=message_properties(
+                        entry.content_type, message_id=entry.message_id, event_type=entry.event_type
+                    ),
+                    routing_key=entry.routing_key,
+                )
+            except PublisherBackpressure:
+                # Release the rest; they are picked up again on the next pass
+                break
+        self.outbox.release([entry.id for entry in batch if entry not in futures])
+
+        wait(futures.values(), timeout=self.confirm_timeout)
+        elapsed = time.perf_counter() - started
+        metrics.EVENT_PUBLISH_DURATION.observe(elapsed)
+        self._latency = elapsed if self.publish_latency is None else 0.8 * self._latency + 0.2 * elapsed
+        self._latency_at = time.monotonic()
+        published = []
+        failed = []
+        for entry, future in futures.items():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                published.append(entry.id)
+            else:
+                future.cancel()
+                failed.append((entry.id, entry.attempts))
+
+        self.outbox.mark_published(published)
+        self.outbox.mark_failed(failed, self._retry_at)
+        if failed:
+            logger.error(
+                "Outbox relay: %d events not confirmed, will retry",
+                len(failed),
+                extra={"event": "outbox_unconfirmed", "unconfirmed": len(failed)},
+            )
+        if len(futures) < len(batch):
+            # Publisher is saturated; give it a moment before handing it more
+            self._stopping.wait(0.05)
+
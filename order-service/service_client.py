@@ -0,0 +1,158 @@
+# order-service/service_client.py
+"""Pooled HTTP clients for order-service's calls to user-service and product-service
+
+Each ServiceClient keeps a small pool of keep-alive connections, so a lookup costs one
+round-trip on an open socket instead of a TCP handshake. Ids are fetched in one
+GET /<resource>?ids=1,2,3 request, and concurrent identical requests share a single
+round-trip through SingleFlight.
+"""
+import http.client
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import metrics
+import serialization
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceUnavailable(Exception):
+    """The service could not be reached or answered with an error"""
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one host, shared by all threads
+
+    At most `size` requests are in flight at once; further callers wait up to `timeout`
+    for a connection. A reused connection the server has already closed is retried once
+    on a fresh one.
+    """
+
+    def __init__(self, base_url, size=10, timeout=2.0):
+        target = urlsplit(base_url)
+        self.scheme = target.scheme
+        self.netloc = target.netloc
+        self.prefix = target.path.rstrip("/")
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.netloc, timeout=self.timeout)
+
+    def request(self, method, path, headers=None):
+        """Send a request without a body; returns (status, body bytes)"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise ServiceUnavailable(f"No free connection to {self.netloc}")
+        try:
+            try:
+                connection, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(), False
+            while True:
+                try:
+                    connection.request(method, self.prefix + path, headers=headers or {})
+                    response = connection.getresponse()
+                    body = response.read()
+                except (OSError, http.client.HTTPException) as e:
+                    connection.close()
+                    if reused:
+                        # Idle keep-alive connections may have been closed by the server
+                        connection, reused = self._connect(), False
+                        continue
+                    raise ServiceUnavailable(f"{method} {self.netloc}{path} failed: {e}") from e
+                break
+            if response.will_close:
+                connection.close()
+            else:
+                self._idle.put(connection)
+            return response.status, body
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key share its result"""
+
+    def __init__(self):
+        self._calls = {}  # key -> Future of the call in flight
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class ServiceClient:
+    """Batched lookups of one service's records by id, e.g. ServiceClient(url, "users")"""
+
+    # Ids per GET /<resource>?ids= request; user-service accepts up to 1000
+    MAX_IDS = 1000
+
+    def __init__(self, base_url, resource, pool_size=10, timeout=2.0):
+        self.resource = resource
+        self.pool = ConnectionPool(base_url, size=pool_size, timeout=timeout)
+        self.flights = SingleFlight()
+
+    def get_many(self, ids):
+        """{id: record} for the ids that exist; raises ServiceUnavailable"""
+        ids = sorted(set(ids))
+        found = {}
+        for start in range(0, len(ids), self.MAX_IDS):
+            path = f"/{self.resource}?ids={','.join(map(str, ids[start : start + self.MAX_IDS]))}"
+            for record in self.flights.do(path, lambda path=path: self._get(path)):
+                found[record["id"]] = record
+        return found
+
+    def missing(self, ids):
+        """The subset of ids that do not exist"""
+        found = self.get_many(ids)
+        return {record_id for record_id in ids if record_id not in found}
+
+    def _get(self, path):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            status, body = self.pool.request("GET", path, headers={"Accept": "application/json"})
+            if status != 200:
+                raise ServiceUnavailable(f"GET {path} returned {status}")
+            try:
+                records = serialization.loads(body)
+            except ValueError as e:
+                raise ServiceUnavailable(f"GET {path} returned invalid JSON: {e}") from e
+            outcome = "success"
+            return records
+        finally:
+            metrics.SERVICE_CLIENT_DURATION.labels(self.resource, outcome).observe(time.perf_counter() - started)
+
+    def close(self):
+        self.pool.close()
@@ -126,6 +126,14 @@ async function startOrderConsumer(payments) {
     ch.consume("payment_queue", async (msg) => {
       if (!msg) return;
 
+      // Only new orders are paid for; order-service also publishes "order.updated" and
+      // "order.deleted" events to this exchange. Older created events carry no type.
+      const eventType = msg.properties.type;
+      if (eventType && eventType !== "order.created") {
+        ch.ack(msg);
+        return;
+      }
+
       let order;
       try {
         order = JSON.parse(msg.content.toString());
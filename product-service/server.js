@@ -13,8 +13,16 @@ const products = [
   { id: 3, name: 'Tablet', price: 15000, stock: 15 }
 ];
 
-// GET all products
+// GET all products, or several with ?ids=1,2,3 (missing ids are left out)
 app.get('/products', (req, res) => {
+  if (req.query.ids !== undefined) {
+    const ids = String(req.query.ids).split(',').filter(id => id.trim() !== '').map(Number);
+    if (ids.some(id => !Number.isInteger(id))) {
+      return res.status(400).json({ error: "'ids' must be comma-separated integers" });
+    }
+    const wanted = new Set(ids);
+    return res.json(products.filter(p => wanted.has(p.id)));
+  }
   res.json(products);
 });
 
@@ -1,290 +1,204 @@
 #!/usr/bin/env python3
 """
-Grafana Dashboard Creation Script for ecommerce-platform
+Grafana provisioning for ecommerce-platform: the Prometheus data source and the
+dashboards defined in scripts/dashboard*.json
+
+Safe to run repeatedly. Dashboards are matched by uid and only the ones whose
+definition differs from Grafana's copy are posted, concurrently, over one pooled
+session. Updates carry the version that was read, so a dashboard edited in Grafana
+while this runs is reported as a conflict instead of being overwritten (--force
+overwrites it).
+
+    python scripts/create_grafana_dashboards.py --url http://localhost:3000 --dry-run
 """
-import requests
+import argparse
 import json
+import os
+import re
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-GRAFANA_URL = "http://localhost:3000"
-PROMETHEUS_URL = "http://prometheus:9090"
-ADMIN_USER = "admin"
-ADMIN_PASSWORD = "admin"
-
-def create_dashboard(dashboard_json):
-    """Create a dashboard in Grafana"""
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Basic {requests.auth._basic_auth_str(ADMIN_USER, ADMIN_PASSWORD).split(' ')[1]}"
-    }
-    
-    try:
-        response = requests.post(
-            f"{GRAFANA_URL}/api/dashboards/db",
-            json=dashboard_json,
-            headers=headers,
-            timeout=10
-        )
-        return response.status_code
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
-
-def add_data_source():
-    """Add Prometheus data source"""
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Basic {requests.auth._basic_auth_str(ADMIN_USER, ADMIN_PASSWORD).split(' ')[1]}"
-    }
-    
-    payload = {
-        "name": "Prometheus",
-        "type": "prometheus",
-        "url": PROMETHEUS_URL,
-        "access": "proxy",
-        "isDefault": True
-    }
-    
-    try:
-        response = requests.post(
-            f"{GRAFANA_URL}/api/datasources",
-            json=payload,
-            headers=headers,
-            timeout=10
-        )
-        print(f"✓ Prometheus data source added (Status: {response.status_code})")
-    except Exception as e:
-        print(f"⚠ Data source may already exist")
+import requests
+from requests.adapters import HTTPAdapter
 
-def main():
-    print("=" * 50)
-    print("Grafana Dashboard Setup")
-    print("=" * 50)
-    print()
-    
-    print("Adding Prometheus Data Source...")
-    add_data_source()
-    
-    time.sleep(1)
-    
-    # Dashboard 1: Request Latency & Error Rates
-    print("\nCreating Dashboard 1: Request Latency & Error Rates...")
-    dashboard1 = {
-        "dashboard": {
-            "title": "Request Latency and Error Rates",
-            "description": "HTTP request latency and error rate metrics by service",
-            "tags": ["ecommerce", "performance"],
-            "timezone": "browser",
-            "panels": [
-                {
-                    "title": "P95 Request Latency (seconds)",
-                    "targets": [
-                        {
-                            "expr": 'histogram_quantile(0.95, http_request_duration_seconds_bucket)',
-                            "legendFormat": "{{route}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 0, "y": 0}
-                },
-                {
-                    "title": "Error Rate (5xx responses per second)",
-                    "targets": [
-                        {
-                            "expr": 'rate(http_request_duration_seconds_count{status_code=~"5.."}[5m])',
-                            "legendFormat": "{{route}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 12, "y": 0}
-                },
-                {
-                    "title": "Average Response Time by Service",
-                    "targets": [
-                        {
-                            "expr": 'avg(http_request_duration_seconds) by (route)',
-                            "legendFormat": "{{route}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 0, "y": 8}
-                },
-                {
-                    "title": "Request Count by Status",
-                    "targets": [
-                        {
-                            "expr": 'sum(http_request_duration_seconds_count) by (status_code)',
-                            "legendFormat": "{{status_code}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 12, "y": 8}
-                }
-            ]
-        }
-    }
-    
-    status = create_dashboard(dashboard1)
-    if status and 200 <= status < 300:
-        print(f"✓ Dashboard 1 created (Status: {status})")
-    else:
-        print(f"⚠ Dashboard 1 may already exist")
-    
-    time.sleep(1)
-    
-    # Dashboard 2: Payment Metrics
-    print("\nCreating Dashboard 2: Payment Processing Metrics...")
-    dashboard2 = {
-        "dashboard": {
-            "title": "Payment Processing Metrics",
-            "description": "Payment success rates, amounts, and volumes",
-            "tags": ["ecommerce", "payments"],
-            "timezone": "browser",
-            "panels": [
-                {
-                    "title": "Total Payments Processed",
-                    "targets": [
-                        {
-                            "expr": "sum(payments_total)",
-                            "legendFormat": "Total Payments"
-                        }
-                    ],
-                    "type": "stat",
-                    "gridPos": {"h": 4, "w": 6, "x": 0, "y": 0}
-                },
-                {
-                    "title": "Payment Success Rate (%)",
-                    "targets": [
-                        {
-                            "expr": 'sum(payments_total{status="completed"}) / sum(payments_total) * 100',
-                            "legendFormat": "Success %"
-                        }
-                    ],
-                    "type": "stat",
-                    "gridPos": {"h": 4, "w": 6, "x": 6, "y": 0}
-                },
-                {
-                    "title": "Total Payment Amount",
-                    "targets": [
-                        {
-                            "expr": "sum(payments_amount_total)",
-                            "legendFormat": "Total Amount"
-                        }
-                    ],
-                    "type": "stat",
-                    "gridPos": {"h": 4, "w": 6, "x": 12, "y": 0}
-                },
-                {
-                    "title": "Payments by Status",
-                    "targets": [
-                        {
-                            "expr": "sum(payments_total) by (status)",
-                            "legendFormat": "{{status}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 0, "y": 4}
-                },
-                {
-                    "title": "Payment Processing Rate (per 5min)",
-                    "targets": [
-                        {
-                            "expr": "rate(payments_total[5m])",
-                            "legendFormat": "{{status}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 12, "y": 4}
-                }
-            ]
-        }
-    }
-    
-    status = create_dashboard(dashboard2)
-    if status and 200 <= status < 300:
-        print(f"✓ Dashboard 2 created (Status: {status})")
-    else:
-        print(f"⚠ Dashboard 2 may already exist")
-    
-    time.sleep(1)
-    
-    # Dashboard 3: System Health
-    print("\nCreating Dashboard 3: System Health & Pod Metrics...")
-    dashboard3 = {
-        "dashboard": {
-            "title": "System Health and Pod Metrics",
-            "description": "Kubernetes pod resources and system health",
-            "tags": ["ecommerce", "kubernetes", "system"],
-            "timezone": "browser",
-            "panels": [
-                {
-                    "title": "Pod Memory Usage (MB)",
-                    "targets": [
-                        {
-                            "expr": 'container_memory_usage_bytes{pod=~".*service.*"} / 1024 / 1024',
-                            "legendFormat": "{{pod}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 0, "y": 0}
-                },
-                {
-                    "title": "Pod CPU Usage (cores)",
-                    "targets": [
-                        {
-                            "expr": 'rate(container_cpu_usage_seconds_total{pod=~".*service.*"}[5m])',
-                            "legendFormat": "{{pod}}"
-                        }
-                    ],
-                    "type": "timeseries",
-                    "gridPos": {"h": 8, "w": 12, "x": 12, "y": 0}
-                },
-                {
-                    "title": "Total Kubernetes Pods",
-                    "targets": [
-                        {
-                            "expr": "count(kube_pod_info)",
-                            "legendFormat": "Total Pods"
-                        }
-                    ],
-                    "type": "stat",
-                    "gridPos": {"h": 4, "w": 6, "x": 0, "y": 8}
-                },
-                {
-                    "title": "Running Pods",
-                    "targets": [
-                        {
-                            "expr": 'count(kube_pod_status_phase{phase="Running"})',
-                            "legendFormat": "Running"
-                        }
-                    ],
-                    "type": "stat",
-                    "gridPos": {"h": 4, "w": 6, "x": 6, "y": 8}
-                }
-            ]
-        }
-    }
-    
-    status = create_dashboard(dashboard3)
-    if status and 200 <= status < 300:
-        print(f"✓ Dashboard 3 created (Status: {status})")
+GRAFANA_URL = os.getenv("GRAFANA_URL", "http://localhost:3000")
+PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus:9090")
+ADMIN_USER = os.getenv("GRAFANA_USER", "admin")
+ADMIN_PASSWORD = os.getenv("GRAFANA_PASSWORD", "admin")
+DASHBOARD_DIR = Path(__file__).resolve().parent
+
+# Grafana assigns these on save, so they never count as a difference
+SERVER_FIELDS = ("id", "uid", "version")
+
+DATA_SOURCE = {
+    "name": "Prometheus",
+    "type": "prometheus",
+    "url": PROMETHEUS_URL,
+    "access": "proxy",
+    "isDefault": True,
+}
+
+
+class GrafanaError(Exception):
+    """Grafana answered a provisioning request with an unexpected status"""
+
+
+class Grafana:
+    """Grafana HTTP API over one keep-alive session shared by all worker threads"""
+
+    def __init__(self, url, user, password, workers=8, timeout=10):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (user, password)
+        self.session.headers.update({"Accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, expect=(200,), **kwargs):
+        """JSON body of the response; raises GrafanaError for statuses not in `expect`"""
+        response = self.session.request(method, self.url + path, timeout=self.timeout, **kwargs)
+        if response.status_code not in expect:
+            raise GrafanaError(f"{method} {path} returned {response.status_code}: {response.text[:200]}")
+        return response.status_code, response.json() if response.content else None
+
+    def wait_until_ready(self, timeout=60):
+        """Poll /api/health until Grafana and its database answer, with capped backoff"""
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while True:
+            try:
+                status, health = self.request("GET", "/api/health", expect=(200, 503))
+                if status == 200 and health.get("database") == "ok":
+                    return health
+                reason = f"database {health.get('database')}"
+            except (requests.RequestException, GrafanaError, ValueError) as e:
+                reason = str(e)
+            if time.monotonic() + delay > deadline:
+                raise GrafanaError(f"Grafana at {self.url} not ready after {timeout}s: {reason}")
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+def ensure_data_source(grafana, desired, dry_run=False):
+    """Create the data source, or update it if its settings drifted; returns the action"""
+    status, existing = grafana.request("GET", f"/api/datasources/name/{desired['name']}", expect=(200, 404))
+    if status == 404:
+        if not dry_run:
+            grafana.request("POST", "/api/datasources", json=desired)
+        return "created"
+    if all(existing.get(key) == value for key, value in desired.items()):
+        return "unchanged"
+    if not dry_run:
+        grafana.request("PUT", f"/api/datasources/uid/{existing['uid']}", json={**existing, **desired})
+    return "updated"
+
+
+def slug(title):
+    return re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")[:40]
+
+
+def load_dashboards(directory, pattern="dashboard*.json"):
+    """{uid: dashboard} from the definition files; a file without a uid gets one from its title"""
+    dashboards = {}
+    for path in sorted(Path(directory).glob(pattern)):
+        definition = json.loads(path.read_text(encoding="utf-8"))
+        dashboard = definition.get("dashboard", definition)
+        uid = dashboard.get("uid") or slug(dashboard["title"])
+        if uid in dashboards:
+            raise ValueError(f"{path.name}: uid {uid!r} is already used by another definition")
+        dashboards[uid] = {**dashboard, "uid": uid}
+    return dashboards
+
+
+def differs(desired, existing):
+    """True if any field the definition sets has another value in Grafana's copy
+
+    Fields Grafana adds on its own, such as schemaVersion, are ignored.
+    """
+    return any(existing.get(key) != value for key, value in desired.items() if key not in SERVER_FIELDS)
+
+
+def sync_dashboard(grafana, dashboard, existing_titles, force=False, dry_run=False):
+    """Bring one dashboard up to date; returns (action, detail)"""
+    uid = dashboard["uid"]
+    status, current = grafana.request("GET", f"/api/dashboards/uid/{uid}", expect=(200, 404))
+    payload = {"dashboard": {**dashboard, "id": None}, "overwrite": force, "message": "Provisioned from scripts/"}
+    if status == 200:
+        if not differs(dashboard, current["dashboard"]):
+            return "unchanged", f"version {current['dashboard'].get('version')}"
+        action = "updated"
+        # Optimistic locking: Grafana rejects the post if someone saved a newer version since
+        payload["dashboard"].update(id=current["dashboard"].get("id"), version=current["dashboard"].get("version"))
+    elif dashboard["title"] in existing_titles:
+        # Created before dashboards had fixed uids; replace it so it takes this uid
+        action = "replaced"
+        payload["overwrite"] = True
     else:
-        print(f"⚠ Dashboard 3 may already exist")
-    
-    print()
-    print("=" * 50)
-    print("✅ Grafana Dashboard Setup Complete!")
-    print("=" * 50)
-    print()
-    print("Grafana URL: http://localhost:3000")
-    print("Login: admin / admin")
-    print()
-    print("Dashboards Created:")
-    print("  1. Request Latency and Error Rates")
-    print("  2. Payment Processing Metrics")
-    print("  3. System Health and Pod Metrics")
-    print()
+        action = "created"
+
+    if dry_run:
+        return f"would be {action}", ""
+    status, result = grafana.request("POST", "/api/dashboards/db", expect=(200, 412), json=payload)
+    if status == 412:
+        return "conflict", f"{result.get('status')}: {result.get('message')} (rerun with --force to overwrite)"
+    return action, f"version {result.get('version')}"
+
+
+def provision(grafana, dashboards, workers=8, force=False, dry_run=False):
+    """Sync every dashboard concurrently; returns [(uid, title, action, detail)]"""
+    _, found = grafana.request("GET", "/api/search", params={"type": "dash-db", "limit": 5000})
+    existing_titles = {hit["title"] for hit in found if not hit.get("folderUid")}
+
+    def sync(dashboard):
+        try:
+            action, detail = sync_dashboard(grafana, dashboard, existing_titles, force, dry_run)
+        except (requests.RequestException, GrafanaError) as e:
+            action, detail = "failed", str(e)
+        return dashboard["uid"], dashboard["title"], action, detail
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(sync, dashboards.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=GRAFANA_URL, help="Grafana base URL (GRAFANA_URL)")
+    parser.add_argument("--user", default=ADMIN_USER, help="Grafana admin user (GRAFANA_USER)")
+    parser.add_argument("--password", default=ADMIN_PASSWORD, help="Grafana admin password (GRAFANA_PASSWORD)")
+    parser.add_argument("--dashboards", default=DASHBOARD_DIR, help="directory with dashboard*.json files")
+    parser.add_argument("--workers", type=int, default=8, help="dashboards posted at once")
+    parser.add_argument("--ready-timeout", type=float, default=60, help="seconds to wait for Grafana to come up")
+    parser.add_argument("--force", action="store_true", help="overwrite dashboards changed in Grafana meanwhile")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without changing it")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    dashboards = load_dashboards(args.dashboards)
+    grafana = Grafana(args.url, args.user, args.password, workers=args.workers)
+
+    print(f"Waiting for Grafana at {grafana.url}...")
+    try:
+        health = grafana.wait_until_ready(timeout=args.ready_timeout)
+        print(f"✓ Grafana {health.get('version', '')} is up")
+        action = ensure_data_source(grafana, DATA_SOURCE, dry_run=args.dry_run)
+        print(f"✓ Prometheus data source {action}")
+        results = provision(grafana, dashboards, workers=args.workers, force=args.force, dry_run=args.dry_run)
+    except (requests.RequestException, GrafanaError) as e:
+        print(f"✗ {e}")
+        return 1
+
+    failed = 0
+    for uid, title, action, detail in results:
+        ok = action not in ("failed", "conflict")
+        failed += not ok
+        print(f"{'✓' if ok else '✗'} {title} [{uid}]: {action}{f' ({detail})' if detail else ''}")
+    print(f"\n{len(results)} dashboards, {failed} failed, in {time.perf_counter() - started:.2f}s")
+    return 1 if failed else 0
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
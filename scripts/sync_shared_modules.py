@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Copy the Python modules order-service and user-service share from order-service,
+which holds the originals, into user-service.
+
+Each service image is built from its own directory, so the shared modules are
+copies, not imports. Edit the order-service file, then run this script:
+
+    python scripts/sync_shared_modules.py          # rewrite the copies
+    python scripts/sync_shared_modules.py --check  # exit 1 if a copy is out of date (CI)
+"""
+import argparse
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SOURCE = "order-service"
+COPIES = ("user-service",)
+MODULES = ("db.py", "journal.py", "response_cache.py", "serialization.py")
+
+
+def body(text):
+    """The module without its leading comment lines (the path and where it is copied)"""
+    lines = text.splitlines(keepends=True)
+    start = 0
+    while start < len(lines) and lines[start].startswith("#"):
+        start += 1
+    return "".join(lines[start:])
+
+
+def copy_of(module, service):
+    original = (REPO_ROOT / SOURCE / module).read_text(encoding="utf-8")
+    header = (
+        f"# {service}/{module}\n"
+        f"# Copy of {SOURCE}/{module}, written by scripts/sync_shared_modules.py. Edit the\n"
+        f"# original, not this file, then rerun the script.\n"
+    )
+    return header + body(original)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report copies that differ from the original")
+    args = parser.parse_args()
+
+    stale = []
+    for service in COPIES:
+        for module in MODULES:
+            path = REPO_ROOT / service / module
+            expected = copy_of(module, service)
+            current = path.read_text(encoding="utf-8") if path.exists() else None
+            if current == expected:
+                continue
+            stale.append(path.relative_to(REPO_ROOT))
+            if not args.check:
+                path.write_text(expected, encoding="utf-8")
+
+    for path in stale:
+        print(f"{'✗ out of date' if args.check else '✓ updated'}: {path}")
+    if args.check and stale:
+        print("Run python scripts/sync_shared_modules.py and commit the result")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,67 +1,181 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
 import os
 
+import metrics
+import serialization
+from response_cache import InvalidationStamps, ResponseCache, cached_json_response
+from user_repository import create_user_repository, DuplicateEmailError
+
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
+serialization.init_app(app)
+
+# User storage, indexed by id and unique email. In memory by default; set USER_STORE_URL
+# (postgresql://... or sqlite:///path.db) to share users between workers and replicas.
+# USER_JOURNAL_DIR keeps the in-memory users across restarts of a single worker: changes
+# go to a write-ahead log there and startup loads the latest snapshot plus the log tail.
+# JOURNAL_SYNC=always makes each write wait for a (shared, group-committed) fsync;
+# "interval" fsyncs every JOURNAL_SYNC_INTERVAL seconds and "off" leaves it to the OS.
+USER_STORE_URL = os.getenv('USER_STORE_URL')
+USER_STORE_POOL_SIZE = int(os.getenv('USER_STORE_POOL_SIZE', 10))
+users = create_user_repository(
+    USER_STORE_URL,
+    [
+        {'id': 1, 'name': 'Anas', 'email': 'anas@example.com', 'role': 'admin'},
+        {'id': 2, 'name': 'Abrar', 'email': 'abrar@example.com', 'role': 'user'},
+        {'id': 3, 'name': 'Omer', 'email': 'omer@example.com', 'role': 'user'}
+    ],
+    pool_size=USER_STORE_POOL_SIZE,
+    journal_dir=os.getenv('USER_JOURNAL_DIR'),
+    sync=os.getenv('JOURNAL_SYNC', 'always'),
+    sync_interval=float(os.getenv('JOURNAL_SYNC_INTERVAL', 1)),
+    snapshot_records=int(os.getenv('JOURNAL_SNAPSHOT_RECORDS', 100000)),
+    snapshot_interval=float(os.getenv('JOURNAL_SNAPSHOT_INTERVAL', 300)),
+)
+
+# Serialized GET /users/<id> responses. Writes invalidate them in every process that
+# maps RESPONSE_CACHE_SHARED_PATH (gunicorn.conf.py sets it for multiple workers);
+# RESPONSE_CACHE_TTL bounds staleness for changes made by other replicas.
+user_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 5)),
+    stamps=InvalidationStamps(path=os.getenv('RESPONSE_CACHE_SHARED_PATH')),
+)
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+# Pagination limits for GET /users?limit=&after=
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def wants_ndjson():
+    """True when the client asked for a streamed NDJSON response"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def ndjson_response(records):
+    """Stream records as newline-delimited JSON, one encoded record at a time"""
+    def generate():
+        for record in records:
+            yield serialization.dumps(record) + b'\n'
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def parse_ids(value):
+    """Ids from a comma-separated ?ids= value, or None if any is not an integer"""
+    try:
+        return [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        return None
+
+def email_error(data):
+    """Why a user payload cannot be stored, or None
 
-# Mock database - in memory
-users = [
-    {'id': 1, 'name': 'Anas', 'email': 'anas@example.com', 'role': 'admin'},
-    {'id': 2, 'name': 'Abrar', 'email': 'abrar@example.com', 'role': 'user'},
-    {'id': 3, 'name': 'Omer', 'email': 'omer@example.com', 'role': 'user'}
-]
+    The email is the key of the unique email index, so it must be a string or null.
+    """
+    if not isinstance(data, dict):
+        return 'User must be a JSON object'
+    if not isinstance(data.get('email'), (str, type(None))):
+        return "'email' must be a string"
+    return None
 
-# GET all users
+# GET all users, look one up with ?email=, or several with ?ids=1,2,3
+# ?limit=&after= returns one keyset page plus a "next" cursor; ?format=ndjson streams
 @app.route('/users', methods=['GET'])
 def get_users():
-    return jsonify(users), 200
+    email = request.args.get('email')
+    if email is not None:
+        user = users.get_by_email(email)
+        return jsonify([user] if user else []), 200
+
+    ids = request.args.get('ids')
+    if ids is not None:
+        user_ids = parse_ids(ids)
+        if user_ids is None:
+            return jsonify({'error': "'ids' must be comma-separated integers"}), 400
+        if len(user_ids) > MAX_PAGE_SIZE:
+            return jsonify({'error': f'At most {MAX_PAGE_SIZE} ids per request'}), 413
+        # Users that exist, in the order asked for; missing ids are simply left out
+        found = users.get_many(user_ids)
+        return jsonify([found[user_id] for user_id in dict.fromkeys(user_ids) if user_id in found]), 200
+
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+
+    if wants_ndjson():
+        return ndjson_response(users.scan(after=after))
+
+    if limit is not None or after is not None:
+        limit = min(max(limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+        page, next_cursor = users.page(after=after, limit=limit)
+        return jsonify({'data': page, 'next': next_cursor}), 200
+
+    return jsonify(users.all()), 200
 
 # GET single user
 @app.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
-    user = next((u for u in users if u['id'] == user_id), None)
-    if not user:
+    response = cached_json_response(user_cache, user_key(user_id), lambda: users.get(user_id))
+    if response is None:
         return jsonify({'error': 'User not found'}), 404
-    return jsonify(user), 200
+    return response
 
 # CREATE new user
 @app.route('/users', methods=['POST'])
 def create_user():
     data = request.get_json()
-    new_user = {
-        'id': max([u['id'] for u in users]) + 1,
-        'name': data.get('name'),
-        'email': data.get('email'),
-        'role': data.get('role', 'user')
-    }
-    users.append(new_user)
+    error = email_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        new_user = users.create({
+            'name': data.get('name'),
+            'email': data.get('email'),
+            'role': data.get('role', 'user')
+        })
+    except DuplicateEmailError as e:
+        return jsonify({'error': str(e)}), 409
     return jsonify(new_user), 201
 
 # UPDATE user
 @app.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = users.get(user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
     data = request.get_json()
-    user['name'] = data.get('name', user['name'])
-    user['email'] = data.get('email', user['email'])
-    user['role'] = data.get('role', user['role'])
+    error = email_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        user = users.update(
+            user_id,
+            name=data.get('name', user['name']),
+            email=data.get('email', user['email']),
+            role=data.get('role', user['role'])
+        )
+    except DuplicateEmailError as e:
+        return jsonify({'error': str(e)}), 409
+    user_cache.invalidate(user_key(user_id))
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
     
     return jsonify(user), 200
 
 # DELETE user
 @app.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
-    global users
-    user = next((u for u in users if u['id'] == user_id), None)
+    user = users.delete(user_id)
+    user_cache.invalidate(user_key(user_id))
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    users = [u for u in users if u['id'] != user_id]
     return jsonify({'message': 'User deleted', 'user': user}), 200
 
 # HEALTH CHECK
@@ -69,10 +183,11 @@ def delete_user(user_id):
 def health():
     return jsonify({
         'status': 'User Service UP',
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': datetime.now(),
         'service': 'user-service'
     }), 200
 
 if __name__ == '__main__':
+    # Local development server only; containers serve through gunicorn (gunicorn.conf.py)
     port = int(os.getenv('PORT', 3002))
-    app.run(debug=True, port=port, host='0.0.0.0')
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', port=port, host='0.0.0.0')
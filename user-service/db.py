@@ -0,0 +1,207 @@
+# user-service/db.py
+# Copy of order-service/db.py, written by scripts/sync_shared_modules.py. Edit the
+# original, not this file, then rerun the script.
+"""Pooled SQL connections for the durable storage backends
+
+Supports PostgreSQL (psycopg2) and SQLite, which stands in for PostgreSQL in tests and
+single-node setups. Statements are written once with '?' placeholders. On PostgreSQL
+each distinct statement is PREPAREd the first time a connection runs it and executed
+with EXECUTE afterwards; SQLite reuses compiled statements through its statement cache.
+"""
+import contextlib
+import queue
+import sqlite3
+import threading
+from urllib.parse import urlparse
+
+try:
+    import psycopg2
+    import psycopg2.extras
+except ImportError:  # optional; only needed for postgresql:// URLs
+    psycopg2 = None
+
+
+class _SqliteDialect:
+    integrity_errors = (sqlite3.IntegrityError,)
+    data_errors = ()
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, cached_statements=512)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def raw(self, conn):
+        return conn
+
+    def execute(self, conn, sql, params):
+        return conn.execute(sql, params)
+
+    def executemany(self, conn, sql, seq):
+        return conn.executemany(sql, seq)
+
+
+class _PgConnection:
+    """A psycopg2 connection plus the statements already prepared on it"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.prepared = {}  # sql -> (statement name, parameter count)
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class _PostgresDialect:
+    def __init__(self, dsn):
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 is required for postgresql:// storage URLs")
+        self.dsn = dsn
+        self.integrity_errors = (psycopg2.IntegrityError,)
+        self.data_errors = (psycopg2.DataError,)
+
+    def connect(self):
+        return _PgConnection(psycopg2.connect(self.dsn))
+
+    def raw(self, conn):
+        return conn.conn
+
+    def _prepared(self, conn, sql):
+        statement = conn.prepared.get(sql)
+        if statement is None:
+            parts = sql.split("?")
+            pg_sql = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+            name = f"stmt_{len(conn.prepared)}"
+            with conn.conn.cursor() as cursor:
+                cursor.execute(f"PREPARE {name} AS {pg_sql}")
+            statement = conn.prepared[sql] = (name, len(parts) - 1)
+        name, arity = statement
+        return f"EXECUTE {name} ({', '.join(['%s'] * arity)})" if arity else f"EXECUTE {name}"
+
+    def execute(self, conn, sql, params):
+        cursor = conn.conn.cursor()
+        cursor.execute(self._prepared(conn, sql), params)
+        return cursor
+
+    def executemany(self, conn, sql, seq):
+        cursor = conn.conn.cursor()
+        # Sends the rows in pages of EXECUTE statements rather than one round-trip each
+        psycopg2.extras.execute_batch(cursor, self._prepared(conn, sql), seq, page_size=500)
+        return cursor
+
+
+def _dialect_for(url):
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        return _SqliteDialect(url[len("sqlite:///") :])
+    if parsed.scheme in ("postgres", "postgresql"):
+        return _PostgresDialect(url)
+    raise ValueError(f"Unsupported storage URL: {url}")
+
+
+class Session:
+    """One pooled connection for the duration of a transaction"""
+
+    def __init__(self, dialect, conn):
+        self._dialect = dialect
+        self._conn = conn
+
+    def execute(self, sql, params=()):
+        try:
+            return self._dialect.execute(self._conn, sql, params)
+        except self._dialect.data_errors as e:
+            raise ValueError(str(e)) from None
+
+    def executemany(self, sql, seq):
+        try:
+            return self._dialect.executemany(self._conn, sql, seq)
+        except self._dialect.data_errors as e:
+            raise ValueError(str(e)) from None
+
+    def execute_ddl(self, sql):
+        """Run schema statements as-is; DDL cannot be prepared"""
+        cursor = self._dialect.raw(self._conn).cursor()
+        cursor.execute(sql)
+        return cursor
+
+    def fetchall(self, sql, params=()):
+        return self.execute(sql, params).fetchall()
+
+    def fetchone(self, sql, params=()):
+        # Drains the cursor so statements with RETURNING finish before the commit
+        rows = self.execute(sql, params).fetchall()
+        return rows[0] if rows else None
+
+
+class Database:
+    """A bounded pool of connections to one database
+
+    Connections are opened lazily, reused LIFO so the warmest one is picked first, and
+    discarded if a rollback fails. Each session commits on success and rolls back on error.
+    """
+
+    def __init__(self, url, pool_size=10, acquire_timeout=30):
+        self.url = url
+        self.dialect = _dialect_for(url)
+        self.integrity_errors = self.dialect.integrity_errors
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    @contextlib.contextmanager
+    def session(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f"No database connection free after {self.acquire_timeout} seconds")
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.dialect.connect()
+            yield Session(self.dialect, conn)
+            conn.commit()
+        except BaseException:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    _close_quietly(conn)
+                    conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def fetchall(self, sql, params=()):
+        with self.session() as session:
+            return session.fetchall(sql, params)
+
+    def fetchone(self, sql, params=()):
+        with self.session() as session:
+            return session.fetchone(sql, params)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
@@ -0,0 +1,56 @@
+# user-service/gunicorn.conf.py
+# Production serving settings; every value can be overridden through the environment.
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', 3002)}"
+
+# Without USER_STORE_URL users live in each worker's memory, so the default is one
+# worker per pod with a thread pool sized to the available cores (UserRepository is safe
+# to share between the threads). With a shared database the default scales with the cores.
+workers = int(
+    os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1 if os.getenv('USER_STORE_URL') else 1)
+)
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', multiprocessing.cpu_count() * 4))
+
+# Import the app once in the master and fork it into workers. Not with USER_JOURNAL_DIR:
+# a replacement worker must recover the users from disk, not inherit the master's copy.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true' and not os.getenv('USER_JOURNAL_DIR')
+
+# Keep idle upstream connections open longer than Kong's 60s keepalive, so Kong never
+# reuses a connection the worker has just closed
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+accesslog = None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# Each worker keeps its own metric values and response cache; when there is more than
+# one, aggregate the metrics and share cache invalidations
+if workers > 1:
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='prometheus-'))
+    # Workers share one table of invalidation stamps, so a write in one worker evicts the
+    # cached response in all of them
+    os.environ.setdefault(
+        'RESPONSE_CACHE_SHARED_PATH',
+        os.path.join(tempfile.mkdtemp(prefix='response-cache-'), 'invalidations'),
+    )
+
+
+def worker_exit(server, worker):
+    # Snapshot the users so the replacement worker starts without replaying the log
+    from app import users
+
+    if hasattr(users, 'close_journal'):
+        users.close_journal()
+
+
+def child_exit(server, worker):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,61 @@
+# user-service/metrics.py
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Same name and labels as payment-service's prom-client histogram, so the Grafana
+# latency dashboards cover the Python services too
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Duration of HTTP requests in seconds',
+    ['method', 'route', 'status_code'],
+)
+
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    'http_response_cache_lookups_total',
+    'Lookups in the cached GET responses, by whether the body was served from the cache',
+    ['result'],
+)
+
+
+def collect():
+    """Exposition text for this process, or for all gunicorn workers in multiprocess mode"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_app(app):
+    """Time every request into HTTP_REQUEST_DURATION and serve GET /metrics"""
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            # The URL rule, not the raw path, keeps label cardinality bounded
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            HTTP_REQUEST_DURATION.labels(request.method, route, response.status_code).observe(
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(collect(), mimetype=CONTENT_TYPE_LATEST)
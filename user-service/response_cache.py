@@ -0,0 +1,131 @@
+# user-service/response_cache.py
+# Copy of order-service/response_cache.py, written by scripts/sync_shared_modules.py. Edit the
+# original, not this file, then rerun the script.
+import hashlib
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+from flask import Response, current_app, request
+
+import metrics
+
+CachedResponse = namedtuple("CachedResponse", "body etag stamp expires_at")
+
+_STAMP = struct.Struct("<Q")
+
+
+class InvalidationStamps:
+    """A table of 64-bit stamps, one per hash slot of the cache keys
+
+    Invalidating a key writes a stamp no process has written before into its slot. A
+    cached entry remembers the stamp its slot had when the entry was loaded, and it is
+    stale as soon as the two differ. When `path` is given, the table is a memory-mapped
+    file, so every process that maps it (e.g. all gunicorn workers on a host) sees the
+    others' invalidations without any messages being exchanged.
+    """
+
+    def __init__(self, slots=65536, path=None):
+        self.slots = slots
+        size = slots * _STAMP.size
+        if path:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+                self._table = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        else:
+            self._table = bytearray(size)
+        # pid in the high bits keeps stamps written by different processes distinct
+        self._counter = itertools.count(1)
+
+    def slot(self, key):
+        return zlib.crc32(key.encode("utf-8")) % self.slots
+
+    def current(self, slot):
+        return _STAMP.unpack_from(self._table, slot * _STAMP.size)[0]
+
+    def bump(self, slot):
+        stamp = (os.getpid() << 40 | next(self._counter)) & 0xFFFFFFFFFFFFFFFF
+        _STAMP.pack_into(self._table, slot * _STAMP.size, stamp)
+
+
+class ResponseCache:
+    """Bounded LRU of pre-serialized JSON response bodies with a TTL and ETags
+
+    Entries are looked up by key (e.g. "order:42"). Writers call invalidate(key) after
+    changing the resource; TTL bounds how stale an entry can get when the change was
+    made somewhere invalidations do not reach, such as another replica.
+    """
+
+    def __init__(self, max_entries=10000, ttl=30, stamps=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stamps = stamps or InvalidationStamps()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """The cached response for `key`, or None if it is missing, expired or invalidated"""
+        stamp = self.stamps.current(self.stamps.slot(key))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.stamp != stamp or entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def stamp(self, key):
+        """Read before loading a value, then pass to put(), so a concurrent invalidation wins"""
+        return self.stamps.current(self.stamps.slot(key))
+
+    def put(self, key, body, stamp):
+        entry = CachedResponse(
+            body, f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"', stamp, time.monotonic() + self.ttl
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, *keys):
+        for key in keys:
+            self.stamps.bump(self.stamps.slot(key))
+            with self._lock:
+                self._entries.pop(key, None)
+
+
+def cached_json_response(cache, key, load):
+    """Serve `key` from the cache, calling load() and caching its JSON on a miss
+
+    Returns None when load() finds nothing; misses are not cached. Answers 304 when the
+    request's If-None-Match already names the current body.
+    """
+    entry = cache.get(key)
+    metrics.RESPONSE_CACHE_LOOKUPS.labels("hit" if entry is not None else "miss").inc()
+    if entry is None:
+        stamp = cache.stamp(key)
+        value = load()
+        if value is None:
+            return None
+        # Same bytes jsonify() would produce
+        entry = cache.put(key, current_app.json.response(value).get_data(), stamp)
+
+    if request.if_none_match.contains(entry.etag.strip('"')):
+        return Response(status=304, headers={"ETag": entry.etag})
+    return Response(entry.body, mimetype="application/json", headers={"ETag": entry.etag})
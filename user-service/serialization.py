@@ -0,0 +1,85 @@
+# user-service/serialization.py
+# Copy of order-service/serialization.py, written by scripts/sync_shared_modules.py. Edit the
+# original, not this file, then rerun the script.
+"""Fast JSON encoding shared by Flask responses and AMQP payloads
+
+dumps() returns UTF-8 bytes ready for a response body or a message. With orjson
+installed the bytes are written directly, with no intermediate str, and datetime, date
+and UUID values are serialized natively as ISO 8601 strings. Without orjson the same
+types go through a stdlib json fallback.
+"""
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used when it is not installed
+    orjson = None
+
+
+def json_default(value):
+    """Encodes the types stdlib json cannot, the way orjson does"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _stdlib_dumps(value):
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(value):
+        """Serialize to compact UTF-8 JSON bytes"""
+        try:
+            return orjson.dumps(value, default=json_default, option=_OPTIONS)
+        except TypeError:
+            # Integers beyond 64 bits and other values orjson rejects
+            return _stdlib_dumps(value)
+
+    def loads(data):
+        """Parse JSON from bytes or str; raises ValueError on invalid input"""
+        return orjson.loads(data)
+
+else:
+    dumps = _stdlib_dumps
+
+    def loads(data):
+        """Parse JSON from bytes or str; raises ValueError on invalid input"""
+        return json.loads(data)
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider on dumps()/loads(); jsonify() bodies skip the str round-trip
+
+    Keys keep their insertion order instead of being sorted.
+    """
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Serve every jsonify() and request.get_json() in `app` through FastJSONProvider"""
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,378 @@
+# user-service/user_repository.py
+import atexit
+import bisect
+import threading
+
+from db import Database
+from journal import Journal
+
+
+class DuplicateEmailError(ValueError):
+    """Raised when a user is saved with an email that already belongs to another user"""
+
+
+def _email_key(email):
+    return email.strip().lower() if isinstance(email, str) else email
+
+
+class UserRepository:
+    """Thread-safe in-memory user storage with id and unique email indexes
+
+    Writers serialise on a single lock that covers the id counter and both
+    indexes. Stored user dicts are never mutated in place: updates swap in a
+    fresh copy, so readers can look users up without taking the lock and
+    always see a consistent record.
+    """
+
+    def __init__(self, users=()):
+        self._by_id = {}
+        self._by_email = {}
+        # Ascending ids for keyset pagination; deleted ids stay until the next compaction
+        self._ids = []
+        self._deleted = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._journal = None
+        for user in users:
+            self.create(user)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def all(self):
+        return list(self._by_id.values())
+
+    def get(self, user_id):
+        return self._by_id.get(user_id)
+
+    def get_many(self, user_ids):
+        """Look up several users; returns {user_id: user} for the ids that exist"""
+        return {user_id: self._by_id[user_id] for user_id in user_ids if user_id in self._by_id}
+
+    def get_by_email(self, email):
+        user_id = self._by_email.get(_email_key(email))
+        return None if user_id is None else self._by_id.get(user_id)
+
+    def create(self, user):
+        """Store a new user, assigning an id unless one is given"""
+        with self._lock:
+            key = _email_key(user.get('email'))
+            if key is not None and key in self._by_email:
+                raise DuplicateEmailError(f"Email already registered: {user.get('email')}")
+
+            user = dict(user)
+            if user.get('id') is None:
+                user['id'] = self._next_id
+            if user['id'] in self._by_id:
+                raise ValueError(f"User id already exists: {user['id']}")
+            ticket = self._log('create', user)
+            self._add(user)
+        self._wait(ticket)
+        return user
+
+    def _add(self, user):
+        self._next_id = max(self._next_id, user['id'] + 1)
+        if not self._ids or user['id'] > self._ids[-1]:
+            self._ids.append(user['id'])
+        else:
+            position = bisect.bisect_left(self._ids, user['id'])
+            if position < len(self._ids) and self._ids[position] == user['id']:
+                self._deleted -= 1
+            else:
+                self._ids.insert(position, user['id'])
+
+        self._by_id[user['id']] = user
+        key = _email_key(user.get('email'))
+        if key is not None:
+            self._by_email[key] = user['id']
+
+    def update(self, user_id, **changes):
+        """Apply field changes to a user, keeping the email index unique"""
+        with self._lock:
+            current = self._by_id.get(user_id)
+            if current is None:
+                return None
+
+            updated = {**current, **changes, 'id': user_id}
+            old_key = _email_key(current.get('email'))
+            new_key = _email_key(updated.get('email'))
+            if new_key != old_key and new_key is not None and new_key in self._by_email:
+                raise DuplicateEmailError(f"Email already registered: {updated.get('email')}")
+            ticket = self._log('update', user_id, changes)
+            if new_key != old_key:
+                self._by_email.pop(old_key, None)
+                if new_key is not None:
+                    self._by_email[new_key] = user_id
+
+            self._by_id[user_id] = updated
+        self._wait(ticket)
+        return updated
+
+    def delete(self, user_id):
+        with self._lock:
+            if user_id not in self._by_id:
+                return None
+            ticket = self._log('delete', user_id)
+            user = self._by_id.pop(user_id)
+            self._by_email.pop(_email_key(user.get('email')), None)
+            self._deleted += 1
+            if self._deleted > len(self._by_id):
+                self._ids = [i for i in self._ids if i in self._by_id]
+                self._deleted = 0
+        self._wait(ticket)
+        return user
+
+    def page(self, after=None, limit=100):
+        """Return up to `limit` users with id > `after` and the cursor for the next page
+
+        The cursor is the id of the last user returned, or None on the last page.
+        """
+        with self._lock:
+            start = 0 if after is None else bisect.bisect_right(self._ids, after)
+            page = []
+            for position in range(start, len(self._ids)):
+                user = self._by_id.get(self._ids[position])
+                if user is None:
+                    continue
+                if len(page) == limit:
+                    return page, page[-1]['id']
+                page.append(user)
+            return page, None
+
+    def scan(self, after=None, chunk_size=1000):
+        """Yield users in id order, holding the lock for one chunk at a time"""
+        while True:
+            chunk, after = self.page(after=after, limit=chunk_size)
+            yield from chunk
+            if after is None:
+                return
+
+    # Durability: with a Journal attached, every change is logged before it is applied
+
+    def _log(self, *record):
+        return 0 if self._journal is None else self._journal.append(record)
+
+    def _wait(self, ticket):
+        # Outside the lock, so writers waiting for the same fsync do not serialise on it
+        if ticket:
+            self._journal.wait(ticket)
+
+    def open_journal(self, journal):
+        """Restore the users recorded in `journal` and log every later change to it
+
+        Call before the repository is shared. Returns True if the journal held any state.
+        """
+        state, records = journal.recover()
+        recovered = state is not None
+        if state is not None:
+            self._next_id = state['next_id']
+            for user in state['users']:
+                self._add(user)
+        for op, *args in records:
+            recovered = True
+            if op == 'create':
+                self.create(*args)
+            elif op == 'update':
+                self.update(args[0], **args[1])
+            elif op == 'delete':
+                self.delete(*args)
+            else:
+                raise ValueError(f'Unknown journal record: {op!r}')
+        self._journal = journal
+        journal.start(self.checkpoint)
+        return recovered
+
+    def checkpoint(self):
+        """Snapshot the repository into its journal so the log up to now can be dropped"""
+        with self._lock:
+            generation = self._journal.rotate()
+            # Stored users are replaced rather than mutated, so a shallow copy is consistent
+            state = {'next_id': self._next_id, 'users': list(self._by_id.values())}
+        self._journal.write_snapshot(generation, state)
+
+    def close_journal(self):
+        """Write a final snapshot and release the journal"""
+        if self._journal is not None:
+            self._journal.close()
+
+
+USER_COLUMNS = ('id', 'name', 'email', 'role')
+_SELECT = f"SELECT {', '.join(USER_COLUMNS)} FROM users"
+
+# email_key holds the normalised email, so the unique index enforces case-insensitive uniqueness
+USER_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS users (
+        id BIGINT PRIMARY KEY,
+        name TEXT,
+        email TEXT,
+        email_key TEXT UNIQUE,
+        role TEXT
+    )""",
+    'CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, next_id BIGINT NOT NULL)',
+    "INSERT INTO id_sequences (name, next_id) VALUES ('users', 1) ON CONFLICT DO NOTHING",
+)
+
+
+class SqlUserRepository:
+    """User storage in PostgreSQL or SQLite, shared by every worker and replica
+
+    Same interface as UserRepository; the database's unique email index replaces the
+    in-memory one, so concurrent writers in different processes cannot register the
+    same email twice.
+    """
+
+    def __init__(self, database, users=()):
+        self.db = database
+        with self.db.session() as session:
+            for statement in USER_SCHEMA:
+                session.execute_ddl(statement)
+        self.seed(users)
+        # Reopened lazily, so no connection is inherited by forked gunicorn workers
+        self.db.close()
+
+    def __len__(self):
+        return self.db.fetchone('SELECT COUNT(*) FROM users')[0]
+
+    @staticmethod
+    def _row(row):
+        return None if row is None else dict(zip(USER_COLUMNS, row))
+
+    @staticmethod
+    def _values(user):
+        return (user['id'], user.get('name'), user.get('email'), _email_key(user.get('email')), user.get('role'))
+
+    def _bump_next_id(self, session, highest):
+        session.execute(
+            "UPDATE id_sequences SET next_id = ? WHERE name = 'users' AND next_id < ?", (highest + 1, highest + 1)
+        )
+
+    def seed(self, users):
+        """Insert users in one batch, skipping any whose id or email is already stored
+
+        Every worker seeds at startup, so existing rows are left alone rather than rejected.
+        """
+        users = [dict(user) for user in users]
+        if not users:
+            return
+        with self.db.session() as session:
+            self._bump_next_id(session, max(user['id'] for user in users))
+            session.executemany(
+                'INSERT INTO users (id, name, email, email_key, role) VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING',
+                [self._values(user) for user in users],
+            )
+
+    def all(self):
+        return [self._row(row) for row in self.db.fetchall(f'{_SELECT} ORDER BY id')]
+
+    def get(self, user_id):
+        return self._row(self.db.fetchone(f'{_SELECT} WHERE id = ?', (user_id,)))
+
+    # Ids per IN (...) lookup; short chunks are padded so every lookup reuses one statement
+    LOOKUP_CHUNK = 100
+
+    def get_many(self, user_ids):
+        """Look up several users; returns {user_id: user} for the ids that exist"""
+        found = {}
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return found
+        sql = f"{_SELECT} WHERE id IN ({', '.join('?' * self.LOOKUP_CHUNK)})"
+        with self.db.session() as session:
+            for start in range(0, len(user_ids), self.LOOKUP_CHUNK):
+                chunk = user_ids[start:start + self.LOOKUP_CHUNK]
+                chunk += [chunk[-1]] * (self.LOOKUP_CHUNK - len(chunk))
+                for row in session.fetchall(sql, chunk):
+                    found[row[0]] = self._row(row)
+        return found
+
+    def get_by_email(self, email):
+        return self._row(self.db.fetchone(f'{_SELECT} WHERE email_key = ?', (_email_key(email),)))
+
+    def create(self, user):
+        """Store a new user, assigning an id unless one is given"""
+        user = dict(user)
+        try:
+            with self.db.session() as session:
+                if user.get('id') is None:
+                    (next_id,) = session.fetchone(
+                        "UPDATE id_sequences SET next_id = next_id + 1 WHERE name = 'users' RETURNING next_id"
+                    )
+                    user['id'] = next_id - 1
+                else:
+                    self._bump_next_id(session, user['id'])
+                session.execute(
+                    'INSERT INTO users (id, name, email, email_key, role) VALUES (?, ?, ?, ?, ?)', self._values(user)
+                )
+        except self.db.integrity_errors:
+            if self.get_by_email(user.get('email')) is not None:
+                raise DuplicateEmailError(f"Email already registered: {user.get('email')}") from None
+            raise ValueError(f"User id already exists: {user['id']}") from None
+        return {column: user.get(column) for column in USER_COLUMNS}
+
+    def update(self, user_id, **changes):
+        """Apply field changes to a user, keeping the email index unique"""
+        changes.pop('id', None)
+        unknown = set(changes) - set(USER_COLUMNS)
+        if unknown:
+            raise KeyError(f"Unknown user fields: {', '.join(sorted(unknown))}")
+        if not changes:
+            return self.get(user_id)
+
+        columns = [column for column in USER_COLUMNS[1:] if column in changes]
+        params = [changes[column] for column in columns]
+        if 'email' in changes:
+            columns.append('email_key')
+            params.append(_email_key(changes['email']))
+        try:
+            row = self.db.fetchone(
+                f"UPDATE users SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ? "
+                f"RETURNING {', '.join(USER_COLUMNS)}",
+                (*params, user_id),
+            )
+        except self.db.integrity_errors:
+            raise DuplicateEmailError(f"Email already registered: {changes.get('email')}") from None
+        return self._row(row)
+
+    def delete(self, user_id):
+        return self._row(
+            self.db.fetchone(f"DELETE FROM users WHERE id = ? RETURNING {', '.join(USER_COLUMNS)}", (user_id,))
+        )
+
+    def page(self, after=None, limit=100):
+        """Return up to `limit` users with id > `after` and the cursor for the next page
+
+        The cursor is the id of the last user returned, or None on the last page.
+        """
+        if after is None:
+            rows = self.db.fetchall(f'{_SELECT} ORDER BY id LIMIT ?', (limit + 1,))
+        else:
+            rows = self.db.fetchall(f'{_SELECT} WHERE id > ? ORDER BY id LIMIT ?', (after, limit + 1))
+        page = [self._row(row) for row in rows[:limit]]
+        return page, page[-1]['id'] if len(rows) > limit else None
+
+    def scan(self, after=None, chunk_size=1000):
+        """Yield users in id order, one keyset page per query"""
+        while True:
+            chunk, after = self.page(after=after, limit=chunk_size)
+            yield from chunk
+            if after is None:
+                return
+
+
+def create_user_repository(url=None, users=(), pool_size=10, journal_dir=None, **journal_options):
+    """In-memory UserRepository when `url` is empty, otherwise SqlUserRepository on that database
+
+    With `journal_dir` the in-memory repository is restored from, and logs every change
+    to, a Journal in that directory; `users` only seed an empty journal.
+    `journal_options` are passed to Journal.
+    """
+    if url:
+        return SqlUserRepository(Database(url, pool_size=pool_size), users)
+    if not journal_dir:
+        return UserRepository(users)
+    repository = UserRepository()
+    if not repository.open_journal(Journal(journal_dir, **journal_options)):
+        for user in users:
+            repository.create(user)
+    atexit.register(repository.close_journal)
+    return repository